@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+from PIL import Image
+from compositor import scaled_size
+from parts import DEFAULT_CACHE_BYTES, PartLibrary, alpha_bbox, file_digest, list_images
+from registry import FACES_DIR, PartRegistry, faces_root
+from storage import atomic_write
+
+PACK_MAGIC = b"ONGPACK1"
+PACK_HEADER = struct.Struct("<8sI")
+PACK_ALIGN = 64
+PACK_VERSION = 1
+DEFAULT_PACK_LEVELS = (1.0, 0.5, 0.25)
+PACK_NAME = "parts.pack"
+
+log = logging.getLogger(__name__)
+
+# Layout: magic, index length, JSON index, then one block of raw RGBA rows
+# per variant and level. Blocks start on PACK_ALIGN boundaries so a loader
+# can map them straight into Pillow images without copying.
+
+
+def align(offset):
+    return (offset + PACK_ALIGN - 1) // PACK_ALIGN * PACK_ALIGN
+
+
+def default_pack_path(root):
+    # The pack of a part tree lives next to its part folders.
+    return os.path.join(root, PACK_NAME)
+
+
+def build_pack(folders, path, levels=DEFAULT_PACK_LEVELS):
+    # Level 0 is always the full-size trimmed image.
+    levels = [1.0] + [scale for scale in levels if scale != 1.0]
+    index = {"version": PACK_VERSION, "parts": {}}
+    blocks = []
+    offset = 0
+    packed = {}
+    for folder, folder_path in folders.items():
+        entries = []
+        for filename in list_images(folder_path):
+            img_path = os.path.join(folder_path, filename)
+            digest = file_digest(img_path)
+            if digest in packed:
+                # Identical files point at the blocks already written.
+                entries.append(dict(packed[digest], name=filename))
+                continue
+            with Image.open(img_path) as source:
+                image = source.convert("RGBA")
+            bbox = alpha_bbox(image)
+            trimmed = image.crop(bbox)
+            entry_levels = []
+            for scale in levels:
+                level = trimmed if scale == 1.0 else trimmed.resize(scaled_size(trimmed.size, scale), Image.LANCZOS)
+                data = level.tobytes()
+                entry_levels.append({"scale": scale, "size": list(level.size), "offset": offset, "length": len(data)})
+                blocks.append(data)
+                offset = align(offset + len(data))
+            packed[digest] = {
+                "name": filename,
+                "digest": digest,
+                "size": list(image.size),
+                "bbox": list(bbox),
+                "anchor": [image.width // 2 - bbox[0], image.height // 2 - bbox[1]],
+                "levels": entry_levels,
+            }
+            entries.append(packed[digest])
+        index["parts"][folder] = entries
+
+    header = json.dumps(index, separators=(",", ":")).encode("utf-8")
+    with atomic_write(path, "wb") as f:
+        f.write(PACK_HEADER.pack(PACK_MAGIC, len(header)))
+        f.write(header)
+        f.write(b"\0" * (align(f.tell()) - f.tell()))
+        for data in blocks:
+            f.write(data)
+            f.write(b"\0" * (align(len(data)) - len(data)))
+    return index
+
+
+def pack_is_stale(pack_path, root, parts):
+    # True when a loose part file or folder changed after the pack was
+    # written. Only mtimes are compared, so a current pack still opens
+    # without a single file being hashed; parts with no folder (a
+    # pack-only install) are skipped.
+    built = os.stat(pack_path).st_mtime_ns
+    for folder in parts:
+        path = os.path.join(root, folder)
+        try:
+            if os.stat(path).st_mtime_ns > built:
+                return True
+            for filename in list_images(path):
+                if os.stat(os.path.join(path, filename)).st_mtime_ns > built:
+                    return True
+        except OSError:
+            continue
+    return False
+
+
+def open_library(root=None, pack_path=None, parts=None, cache_bytes=DEFAULT_CACHE_BYTES):
+    # Parts come from a pack when it holds all of them: the one given, or
+    # else the default pack of root unless the loose files changed after
+    # it was built. Only without a usable pack is the root scanned.
+    root = os.path.abspath(root or faces_root())
+    explicit = pack_path is not None
+    if not explicit:
+        pack_path = default_pack_path(root)
+    if pack_path and os.path.exists(pack_path):
+        pack = AssetPack(pack_path)
+        wanted = parts if parts is not None else pack.parts()
+        if not set(wanted) <= set(pack.parts()):
+            log.info("%s lacks some of %s; reading the part folders", pack_path, ", ".join(wanted))
+        elif not explicit and pack_is_stale(pack_path, root, wanted):
+            log.warning("%s is older than the part files under %s; reading the part folders "
+                        "(rebuild the pack with assetpack.py)", pack_path, root)
+        else:
+            log.info("reading parts from %s", pack_path)
+            return PartLibrary.from_pack(pack, cache_bytes)
+    log.info("reading parts from the folders under %s", root)
+    return PartLibrary.from_registry(PartRegistry(root), cache_bytes, parts)
+
+
+class AssetPack:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_length = PACK_HEADER.unpack_from(self.mmap, 0)
+        if magic != PACK_MAGIC:
+            raise ValueError("%s is not a part pack" % path)
+        self.index = json.loads(self.mmap[PACK_HEADER.size:PACK_HEADER.size + header_length])
+        if self.index["version"] != PACK_VERSION:
+            raise ValueError("%s has unsupported pack version %r" % (path, self.index["version"]))
+        self.data_start = align(PACK_HEADER.size + header_length)
+        self.buffer = memoryview(self.mmap)
+
+    def parts(self):
+        return list(self.index["parts"])
+
+    def entries(self, folder):
+        return self.index["parts"][folder]
+
+    def pixels(self, folder, index, level=0):
+        entry = self.index["parts"][folder][index]["levels"][level]
+        start = self.data_start + entry["offset"]
+        return self.buffer[start:start + entry["length"]], tuple(entry["size"])
+
+    def image(self, folder, index, level=0):
+        # RGBA is one of the modes Pillow maps directly onto the buffer, so
+        # the returned image is a read-only view of the pack, not a copy.
+        data, size = self.pixels(folder, index, level)
+        return Image.frombuffer("RGBA", size, data, "raw", "RGBA", 0, 1)
+
+    def image_at_scale(self, folder, index, scale):
+        for level, entry in enumerate(self.index["parts"][folder][index]["levels"]):
+            if entry["scale"] == scale:
+                return self.image(folder, index, level)
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a packed part library from a faces/ tree.")
+    parser.add_argument("root", nargs="?", help="directory holding one folder per part (default: %s)" % FACES_DIR)
+    parser.add_argument("-o", "--output", help="pack file to write (default: %s in the root)" % PACK_NAME)
+    parser.add_argument("--levels", type=float, nargs="+", default=list(DEFAULT_PACK_LEVELS),
+                        help="scale levels stored for every variant")
+    args = parser.parse_args(argv)
+
+    root = args.root or faces_root()
+    folders = PartRegistry(root).folders
+    if not folders:
+        parser.error("no part folders with images under %s" % root)
+    output = args.output or default_pack_path(root)
+    index = build_pack(folders, output, args.levels)
+    counts = ", ".join("%s: %d" % (folder, len(entries)) for folder, entries in index["parts"].items())
+    print("Wrote %s (%s)" % (output, counts))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
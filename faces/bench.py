@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+import argparse
+import heapq
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+DEFAULT_SIZES = (10, 100, 1000)
+DEFAULT_EVENTS = 200
+DEFAULT_SCROLL_STEPS = 2000
+DEFAULT_FRAMES = 600
+IDLE_SECONDS = 1.0
+SYNTHETIC_SIZE = (200, 150)
+SYNTHETIC_PARTS = ("hair", "eyes", "nose", "lips")
+LOAD_TIMEOUT = 120
+
+# Every benchmark runs in a child process of its own, so the peak RSS it
+# reports belongs to that benchmark alone. The output is one JSON document,
+#   {"meta": {...}, "results": [{"benchmark": ..., "variants": ..., ...}]}
+# with times in milliseconds, rates per second and memory in MiB.
+
+
+def make_folder(path, count, size=SYNTHETIC_SIZE):
+    from PIL import Image, ImageDraw
+    os.makedirs(path, exist_ok=True)
+    for i in range(count):
+        image = Image.new("RGBA", size, (0, 0, 0, 0))
+        draw = ImageDraw.Draw(image)
+        draw.ellipse((10 + i % 40, 10, size[0] - 10, size[1] - 10 - i % 40), fill=(i * 37 % 256, 90, 160, 255))
+        image.save(os.path.join(path, "%05d.png" % i))
+    return path
+
+
+def make_library(root, variants):
+    for part in SYNTHETIC_PARTS:
+        make_folder(os.path.join(root, part), variants)
+    return root
+
+
+def peak_rss_mib():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return round(peak / (1024.0 * 1024 if sys.platform == "darwin" else 1024.0), 1)
+
+
+def latency(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {}
+    return {
+        "count": len(samples),
+        "mean_ms": round(sum(samples) / len(samples) * 1e3, 3),
+        "p50_ms": round(samples[len(samples) // 2] * 1e3, 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1e3, 3),
+        "max_ms": round(samples[-1] * 1e3, 3),
+    }
+
+
+def timed(fn, count):
+    samples = []
+    for i in range(count):
+        started = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def wait_until(pump, done, timeout=LOAD_TIMEOUT):
+    deadline = time.perf_counter() + timeout
+    while not done():
+        if time.perf_counter() > deadline:
+            raise RuntimeError("timed out waiting for the images to load")
+        pump()
+        time.sleep(0.001)
+
+
+class HeadlessRoot:
+    # Stands in for tk.Tk without a display: after() jobs run from update()
+    # once they are due, everything else is ignored.
+    def __init__(self):
+        self.jobs = []
+        self.ids = itertools.count()
+
+    def title(self, text):
+        pass
+
+    def bind(self, sequence, func):
+        pass
+
+    def protocol(self, name, func):
+        pass
+
+    def destroy(self):
+        pass
+
+    def after(self, ms, func, *args):
+        job = next(self.ids)
+        heapq.heappush(self.jobs, (time.perf_counter() + ms / 1000.0, job, func, args))
+        return job
+
+    def after_cancel(self, job):
+        self.jobs = [entry for entry in self.jobs if entry[1] != job]
+        heapq.heapify(self.jobs)
+
+    def update(self):
+        now = time.perf_counter()
+        while self.jobs and self.jobs[0][0] <= now:
+            _, _, func, args = heapq.heappop(self.jobs)
+            func(*args)
+
+
+class HeadlessCanvas:
+    def __init__(self, master=None, **options):
+        self.width, self.height = 800, 600
+        self.items = itertools.count(1)
+
+    def pack(self, **options):
+        pass
+
+    def bind(self, sequence, func):
+        pass
+
+    def create_image(self, x, y, **options):
+        return next(self.items)
+
+    def itemconfig(self, item, **options):
+        pass
+
+    def coords(self, item, *position):
+        pass
+
+    def delete(self, item):
+        pass
+
+    def winfo_width(self):
+        return self.width
+
+    def winfo_height(self):
+        return self.height
+
+
+class HeadlessPhoto:
+    def __init__(self, image=None, **options):
+        self.image = image
+
+
+def open_tk(headless):
+    import tkinter as tk
+    if not headless:
+        try:
+            root = tk.Tk()
+            root.geometry("800x600")
+            root.update()
+            return root, False
+        except tk.TclError:
+            pass
+    # Only the drawing is stubbed out; decoding, scaling and the scene
+    # bookkeeping still run as they do on screen.
+    import gntk
+    from PIL import ImageTk
+    gntk.Canvas = HeadlessCanvas
+    ImageTk.PhotoImage = HeadlessPhoto
+    return HeadlessRoot(), True
+
+
+def bench_editor(variants, events=DEFAULT_EVENTS, headless=False):
+    import gntk
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["ONEGIN_CACHE_DIR"] = os.path.join(tmp, "cache")
+        faces = make_library(os.path.join(tmp, "faces"), variants)
+        root, stubbed = open_tk(headless)
+
+        def loaded():
+            return all(editor.current_images[folder][0] is editor.compositor.cached(
+                folder, editor.variant_index[folder], editor.scales[folder]) for folder in editor.folders)
+
+        started = time.perf_counter()
+        editor = gntk.ImageEditor(root, pack_path="", faces_root=faces)
+        wait_until(root.update, loaded)
+        load = time.perf_counter() - started
+
+        def zoom(i):
+            editor.scale_image_folder(editor.active_folder, gntk.ZOOM_STEP if i % 2 == 0 else 1 / gntk.ZOOM_STEP)
+            root.update()
+
+        def resize(i):
+            if stubbed:
+                editor.canvas.width = 800 + i % 2 * 40
+            else:
+                root.geometry("%dx600" % (800 + i % 2 * 40))
+            editor.update_image_positions()
+            root.update()
+
+        def switch(i):
+            editor.step_variant(1)
+            root.update()
+
+        zoom_samples = timed(zoom, events)
+        resize_samples = timed(resize, events)
+        switch_samples = timed(switch, events)
+        wait_until(root.update, loaded)
+        editor.on_close()
+        return {"headless": stubbed, "load_ms": round(load * 1e3, 1),
+                "scale_image_folder": latency(zoom_samples),
+                "update_image_positions": latency(resize_samples),
+                "step_variant": latency(switch_samples)}
+
+
+def bench_viewer(variants, steps=DEFAULT_SCROLL_STEPS):
+    # Wheel-scrolls gn.ImageViewer through one part folder, repainting the
+    # view after every step. Every image is decoded before the warm pass, so
+    # it measures the scene work alone.
+    from PyQt5.QtWidgets import QApplication
+    import gn
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["ONEGIN_CACHE_DIR"] = os.path.join(tmp, "cache")
+        faces = make_library(os.path.join(tmp, "faces"), variants)
+        app = QApplication.instance() or QApplication([])
+        started = time.perf_counter()
+        viewer = gn.ImageViewer(faces, "hair", pack_path="")
+        viewer.show()
+        app.processEvents()
+        load = time.perf_counter() - started
+
+        def scroll(i):
+            viewer.next_image()
+            viewer.view.viewport().repaint()
+            app.processEvents()
+
+        cold = timed(scroll, variants)
+        viewer.loader.shutdown()
+        for index in range(variants):
+            viewer.on_image_loaded(index, viewer.decode_image(index))
+        warm = timed(scroll, steps)
+        viewer.close()
+        return {"load_ms": round(load * 1e3, 1), "display_current_image": latency(warm),
+                "cold_images_per_sec": round(len(cold) / sum(cold), 1),
+                "warm_images_per_sec": round(len(warm) / sum(warm), 1)}
+
+
+def bench_trainer(frames=DEFAULT_FRAMES, idle=IDLE_SECONDS):
+    # Runs line.py's main loop on SDL's dummy driver with the frame cap
+    # lifted. Every frame posts the next half of a click on "Show Hint",
+    # which makes the loop redraw the lines; once enough frames were shown
+    # the loop is left idle for a while before QUIT arrives, to measure
+    # the CPU it uses while nothing happens.
+    import pygame
+    import line
+
+    samples = []
+    last = [time.perf_counter()]
+    idle_started = []
+
+    class Clock:
+        def tick(self, framerate=0):
+            return 0
+
+    def quit():
+        pygame.event.post(pygame.event.Event(pygame.QUIT))
+
+    def frame(*args):
+        now = time.perf_counter()
+        samples.append(now - last[0])
+        last[0] = now
+        if len(samples) < frames:
+            kind = pygame.MOUSEBUTTONDOWN if len(samples) % 2 else pygame.MOUSEBUTTONUP
+            pygame.event.post(pygame.event.Event(kind, pos=(60, 25), button=1))
+        elif not idle_started:
+            idle_started.append((time.perf_counter(), time.process_time()))
+            threading.Timer(idle, quit).start()
+
+    pygame.time.Clock = Clock
+    pygame.display.flip = frame
+    pygame.display.update = frame
+    line.main()
+    idle_wall = time.perf_counter() - idle_started[0][0]
+    idle_cpu = time.process_time() - idle_started[0][1]
+    busy = sum(samples[1:])
+    return {"frames": len(samples), "fps": round((len(samples) - 1) / busy, 1), "frame": latency(samples[1:]),
+            "idle_cpu_percent": round(100.0 * idle_cpu / idle_wall, 1)}
+
+
+BENCHMARKS = {"editor": bench_editor, "viewer": bench_viewer, "trainer": bench_trainer}
+# The trainer draws generated lines, not parts, so it runs once.
+SIZED = ("editor", "viewer")
+
+
+def run_child(name, variants, headless):
+    command = [sys.executable, os.path.abspath(__file__), "--child", name]
+    if variants is not None:
+        command += ["--variants", str(variants)]
+    if headless:
+        command.append("--headless")
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        errors = result.stderr.strip().splitlines()
+        return {"error": errors[-1] if errors else "exit code %d" % result.returncode}
+    return json.loads(lines[-1])
+
+
+def run_benchmark(name, variants, headless):
+    if name == "editor":
+        metrics = bench_editor(variants, headless=headless)
+    elif name == "viewer":
+        metrics = bench_viewer(variants)
+    else:
+        metrics = BENCHMARKS[name]()
+    metrics["peak_rss_mib"] = peak_rss_mib()
+    return metrics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run performance benchmarks and print the results as JSON.")
+    parser.add_argument("names", nargs="*", default=list(BENCHMARKS),
+                        help="benchmarks to run: %s" % ", ".join(BENCHMARKS))
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="variants per part in the synthetic libraries")
+    parser.add_argument("--headless", action="store_true", help="stub out Tk drawing even if a display exists")
+    parser.add_argument("-o", "--output", help="write the JSON to this file instead of printing it")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--variants", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        print(json.dumps(run_benchmark(args.child, args.variants, args.headless)))
+        return
+
+    results = []
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark %r" % name)
+        for variants in (args.sizes if name in SIZED else [None]):
+            print("running %s%s" % (name, "" if variants is None else " with %d variants" % variants), file=sys.stderr)
+            result = {"benchmark": name, "variants": variants}
+            result.update(run_child(name, variants, args.headless))
+            results.append(result)
+    report = json.dumps({
+        "meta": {"python": platform.python_version(), "platform": platform.platform(),
+                 "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": results,
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
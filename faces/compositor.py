@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+from PIL import Image
+from parts import ImageCache
+
+DEFAULT_SCALE_CACHE_BYTES = 128 * 1024 * 1024
+SCALE_PRECISION = 3
+MIP_MIN_SIZE = 16
+
+
+class Layer:
+    def __init__(self, folder, index=0, position=(0, 0), scale=1.0):
+        self.folder = folder
+        self.index = index
+        self.position = position
+        self.scale = scale
+
+    def __repr__(self):
+        return "Layer(%r, %r, %r, %r)" % (self.folder, self.index, self.position, self.scale)
+
+
+def scaled_size(size, scale):
+    return (max(1, int(round(size[0] * scale))), max(1, int(round(size[1] * scale))))
+
+
+def scale_key(scale):
+    # Zoom factors are products of wheel steps; rounding keeps float drift
+    # from turning the same zoom level into a new cache entry.
+    return round(scale, SCALE_PRECISION)
+
+
+class ScaleCache:
+    def __init__(self, library, cache_bytes=DEFAULT_SCALE_CACHE_BYTES):
+        self.library = library
+        self.cache = ImageCache(cache_bytes)
+
+    def mip_level(self, folder, index, level):
+        if level == 0:
+            return self.library.image(folder, index)
+        key = (self.library.key(folder, index), "mip", level)
+        image = self.cache.get(key)
+        if image is None:
+            image = self.library.mip(folder, index, level)
+            if image is None:
+                image = self.mip_level(folder, index, level - 1).reduce(2)
+            self.cache.put(key, image)
+        return image
+
+    def source_level(self, folder, index, scale):
+        # The smallest power-of-two level that is still larger than the
+        # target, so resampling always starts from the original pixels.
+        # Decoding trims the margins and only then is the stored size
+        # known, so level 0 comes first even when a smaller level is used.
+        source = self.mip_level(folder, index, 0)
+        original_size = source.size
+        level = 0
+        while scale * 2 ** (level + 1) <= 1.0 and min(original_size) >> (level + 1) >= MIP_MIN_SIZE:
+            level += 1
+        if level:
+            source = self.mip_level(folder, index, level)
+        return source, scaled_size(original_size, scale)
+
+    def cached(self, folder, index, scale):
+        scale = scale_key(scale)
+        if scale == 1.0:
+            return self.library.cached(folder, index)
+        return self.cache.get((self.library.key(folder, index), scale))
+
+    def scaled(self, folder, index, scale):
+        if scale_key(scale) == 1.0:
+            return self.library.image(folder, index)
+        image = self.cached(folder, index, scale)
+        if image is None:
+            source, size = self.source_level(folder, index, scale)
+            image = source.resize(size, Image.LANCZOS)
+            self.cache.put((self.library.key(folder, index), scale_key(scale)), image)
+        return image
+
+    def draft(self, folder, index, scale):
+        image = self.cached(folder, index, scale)
+        if image is None:
+            source, size = self.source_level(folder, index, scale)
+            image = source.resize(size, Image.NEAREST)
+        return image
+
+    def scaled_size(self, folder, index, scale):
+        return scaled_size(self.library.variant(folder, index).stored_size, scale_key(scale))
+
+
+def layer_origin(variant, position, scale):
+    # Top-left corner of the stored pixels for a layer placed at position.
+    # The editor puts its canvas items here too, so exports match the view.
+    scale = scale_key(scale)
+    anchor_x, anchor_y = variant.anchor
+    return (int(round(position[0] - anchor_x * scale)), int(round(position[1] - anchor_y * scale)))
+
+
+def paste_at(canvas, image, left, top):
+    # alpha_composite refuses negative offsets, so clip the layer first.
+    dest_left, dest_top = max(0, left), max(0, top)
+    right = min(canvas.width, left + image.width)
+    bottom = min(canvas.height, top + image.height)
+    if right <= dest_left or bottom <= dest_top:
+        return
+    box = (dest_left - left, dest_top - top, right - left, bottom - top)
+    canvas.alpha_composite(image, (dest_left, dest_top), box)
+
+
+class FaceCompositor:
+    def __init__(self, library, scale_cache_bytes=DEFAULT_SCALE_CACHE_BYTES):
+        self.library = library
+        self.scale_cache = ScaleCache(library, scale_cache_bytes)
+
+    def count(self, folder):
+        return self.library.count(folder)
+
+    def original(self, folder, index):
+        return self.library.image(folder, index)
+
+    def scaled(self, folder, index, scale):
+        return self.scale_cache.scaled(folder, index, scale)
+
+    def cached(self, folder, index, scale):
+        return self.scale_cache.cached(folder, index, scale)
+
+    def draft(self, folder, index, scale):
+        return self.scale_cache.draft(folder, index, scale)
+
+    def scaled_size(self, folder, index, scale):
+        return self.scale_cache.scaled_size(folder, index, scale)
+
+    def origin(self, folder, index, position, scale):
+        return layer_origin(self.library.variant(folder, index), position, scale)
+
+    def render(self, layers, size, background=(0, 0, 0, 0)):
+        face = Image.new("RGBA", size, background)
+        for layer in layers:
+            image = self.scaled(layer.folder, layer.index, layer.scale)
+            paste_at(face, image, *self.origin(layer.folder, layer.index, layer.position, layer.scale))
+        return face
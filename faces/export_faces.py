@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from assetpack import AssetPack
+from compositor import FaceCompositor
+from layout import Layout, load_layout, part_order
+from parts import PartLibrary
+from registry import FACES_DIR, PartRegistry, faces_root
+from storage import atomic_write
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+IN_FLIGHT_PER_WORKER = 4
+DEFAULT_BATCH = 16
+PROGRESS_EVERY = 500
+
+_compositor = None
+
+
+def init_worker(root, pack_path):
+    # Every process opens the library once; a pack is memory-mapped, so the
+    # workers share its pages instead of each decoding the PNGs.
+    global _compositor
+    _compositor = FaceCompositor(open_library(root, pack_path))
+
+
+def open_library(root, pack_path=None):
+    if pack_path:
+        return PartLibrary.from_pack(AssetPack(pack_path))
+    return PartLibrary.from_registry(PartRegistry(root))
+
+
+def face_parts(library, layout):
+    order = [folder for folder in (layout.parts or part_order(library.variants))
+             if folder in library.variants and library.count(folder)]
+    return order, [library.count(folder) for folder in order]
+
+
+def face_name(order, combo):
+    return "_".join("%s-%d" % (folder, index) for folder, index in zip(order, combo)) + ".png"
+
+
+def render_face(layout, order, combo, path):
+    variants = dict(zip(order, combo))
+    face = _compositor.render(layout.layers(variants, order), layout.size)
+    # An interrupted run never leaves a truncated file that a resumed run
+    # would mistake for a finished one.
+    with atomic_write(path, "wb") as f:
+        face.save(f, "PNG")
+    return path
+
+
+def combinations(counts, sample=None, seed=None):
+    total = math.prod(counts)
+    if sample is None or sample >= total:
+        indices = range(total)
+    else:
+        indices = sorted(random.Random(seed).sample(range(total), sample))
+    for number in indices:
+        combo = []
+        for count in reversed(counts):
+            number, index = divmod(number, count)
+            combo.append(index)
+        yield tuple(reversed(combo))
+
+
+def export_faces(root, output, layout, pack_path=None, sample=None, seed=None, workers=DEFAULT_WORKERS,
+                 progress=None):
+    order, counts = face_parts(open_library(root, pack_path), layout)
+    os.makedirs(output, exist_ok=True)
+
+    written = skipped = 0
+    pending = set()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(root, pack_path)) as pool:
+        for combo in combinations(counts, sample, seed):
+            path = os.path.join(output, face_name(order, combo))
+            if os.path.exists(path):
+                skipped += 1
+                continue
+            # Keep only a bounded number of jobs queued, so huge runs do
+            # not materialise every combination up front.
+            if len(pending) >= workers * IN_FLIGHT_PER_WORKER:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+                    written += 1
+                    if progress and written % PROGRESS_EVERY == 0:
+                        progress(written, skipped)
+            pending.add(pool.submit(render_face, layout, order, combo, path))
+        for future in pending:
+            future.result()
+            written += 1
+    return written, skipped
+
+
+def export_array(root, path, layout, pack_path=None, sample=None, seed=None, batch_size=DEFAULT_BATCH,
+                 dtype="uint8", progress=None):
+    # Writes the faces as one (N, height, width, 4) .npy for training
+    # pipelines, streamed into a memory-mapped file. uint8 holds straight
+    # RGBA as the PNGs would; float32 holds premultiplied RGBA in [0, 1],
+    # rendered a batch at a time by the NumPy engine with no per-face
+    # conversion. The part order and each face's variant indices go to a
+    # JSON file next to it.
+    import numpy as np
+    from npengine import ArrayCompositor
+
+    library = open_library(root, pack_path)
+    order, counts = face_parts(library, layout)
+    combos = list(combinations(counts, sample, seed))
+    compositor = FaceCompositor(library)
+    engine = ArrayCompositor(compositor) if dtype == "float32" else None
+    width, height = layout.size
+    faces = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(len(combos), height, width, 4))
+    for start in range(0, len(combos), batch_size):
+        chunk = [layout.layers(dict(zip(order, combo)), order) for combo in combos[start:start + batch_size]]
+        if engine is not None:
+            faces[start:start + len(chunk)] = engine.render_batch(chunk, layout.size)
+        else:
+            # Pillow's integer compositing is the faster way to 8-bit pixels.
+            for row, layers in enumerate(chunk, start):
+                faces[row] = np.asarray(compositor.render(layers, layout.size))
+        if progress and (start + len(chunk)) // PROGRESS_EVERY > start // PROGRESS_EVERY:
+            progress(start + len(chunk), 0)
+    faces.flush()
+    with open(os.path.splitext(path)[0] + ".json", "w", encoding="utf-8") as f:
+        json.dump({"parts": order, "combinations": combos}, f, separators=(",", ":"))
+    return len(combos)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render every (or a sample of) part combination to PNG files or a NumPy array.")
+    parser.add_argument("output", nargs="?", help="directory the faces are written to")
+    parser.add_argument("--array", help="write all faces into this .npy file instead (needs numpy)")
+    parser.add_argument("--dtype", choices=("uint8", "float32"), default="uint8",
+                        help="--array pixels: straight uint8 or premultiplied float32")
+    parser.add_argument("--batch", type=int, default=DEFAULT_BATCH, help="faces rendered at once with --array")
+    parser.add_argument("--layout", help="layout saved from the editor (Ctrl+L)")
+    parser.add_argument("--root", help="directory holding one folder per part (default: %s)" % FACES_DIR)
+    parser.add_argument("--pack", help="asset pack to read parts from instead of --root")
+    parser.add_argument("--sample", type=int, help="render this many random combinations")
+    parser.add_argument("--seed", type=int, help="random seed for --sample")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="worker processes")
+    args = parser.parse_args(argv)
+    if not args.output and not args.array:
+        parser.error("give an output directory or --array")
+
+    layout = load_layout(args.layout) if args.layout else Layout()
+    started = time.time()
+
+    def progress(written, skipped):
+        print("%d written, %d already present, %.0f faces/min"
+              % (written, skipped, written / max(time.time() - started, 1e-6) * 60))
+
+    if args.array:
+        count = export_array(args.root or faces_root(), args.array, layout, args.pack, args.sample, args.seed,
+                             args.batch, args.dtype, progress)
+        print("Done: %d faces in %s" % (count, args.array))
+        return
+
+    written, skipped = export_faces(args.root or faces_root(), args.output, layout, args.pack, args.sample, args.seed,
+                                    args.workers, progress)
+    print("Done: %d written, %d already present in %s" % (written, skipped, args.output))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
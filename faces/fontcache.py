@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import threading
+from PIL import Image, ImageDraw, ImageFont
+from storage import atomic_write, cache_dir
+
+FONT_EXTENSIONS = (".ttf", ".otf", ".ttc")
+REGULAR_STYLES = ("regular", "book", "normal", "roman", "medium")
+SAMPLE_PADDING = 4
+
+log = logging.getLogger(__name__)
+
+
+def font_dirs():
+    home = os.path.expanduser("~")
+    if sys.platform.startswith("win"):
+        windir = os.environ.get("WINDIR", r"C:\Windows")
+        local = os.environ.get("LOCALAPPDATA", "")
+        return [os.path.join(windir, "Fonts"), os.path.join(local, "Microsoft", "Windows", "Fonts")]
+    if sys.platform == "darwin":
+        return ["/System/Library/Fonts", "/Library/Fonts", os.path.join(home, "Library", "Fonts")]
+    return ["/usr/share/fonts", "/usr/local/share/fonts", os.path.join(home, ".local", "share", "fonts"),
+            os.path.join(home, ".fonts")]
+
+
+def list_font_files(dirs=None):
+    for directory in dirs or font_dirs():
+        for path, _, names in os.walk(directory):
+            for name in sorted(names):
+                if name.lower().endswith(FONT_EXTENSIONS):
+                    yield os.path.join(path, name)
+
+
+def fc_list():
+    # fontconfig already knows every family, style and file; asking it is
+    # much faster than opening the files.
+    if shutil.which("fc-list") is None:
+        return None
+    try:
+        output = subprocess.run(["fc-list", "--format", "%{family[0]}\t%{style[0]}\t%{file}\n"],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    faces = []
+    for line in output.decode("utf-8", "replace").splitlines():
+        parts = line.split("\t")
+        if len(parts) == 3 and parts[0]:
+            faces.append(tuple(parts))
+    return faces
+
+
+def probe_fonts(dirs=None, cache_file=None):
+    # Without fontconfig every file has to be opened once; what was read is
+    # kept on disk and files whose mtime did not change are not opened again.
+    cache_file = cache_file or os.path.join(cache_dir(), "fonts", "faces.json")
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            known = json.load(f)
+    except (OSError, ValueError):
+        known = {}
+    probed = {}
+    for path in list_font_files(dirs):
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            entry = known.get(path)
+            if entry is None or entry[0] != mtime:
+                family, style = ImageFont.truetype(path, 12).getname()
+                entry = [mtime, family, style or ""]
+        except OSError as e:
+            log.info("skipping %s: %s", path, e)
+            continue
+        probed[path] = entry
+    if probed != known:
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            with atomic_write(cache_file) as f:
+                json.dump(probed, f)
+        except OSError as e:
+            log.warning("cannot write font list %s: %s", cache_file, e)
+    return [(family, style, path) for path, (mtime, family, style) in probed.items()]
+
+
+def font_faces(dirs=None):
+    # [(family, style, path)] for every installed font face.
+    faces = fc_list() if dirs is None else None
+    return faces if faces is not None else probe_fonts(dirs)
+
+
+def font_files(faces=None):
+    # {family: path}, preferring the upright regular face of each family.
+    files = {}
+    for family, style, path in sorted(faces if faces is not None else font_faces(),
+                                      key=lambda face: face[1].lower() not in REGULAR_STYLES):
+        files.setdefault(family, path)
+    return files
+
+
+def render_sample(path, text, size):
+    font = ImageFont.truetype(path, size)
+    left, top, right, bottom = font.getbbox(text)
+    image = Image.new("RGBA", (max(right - left, 1) + 2 * SAMPLE_PADDING, max(bottom - top, 1) + 2 * SAMPLE_PADDING),
+                      (0, 0, 0, 0))
+    ImageDraw.Draw(image).text((SAMPLE_PADDING - left, SAMPLE_PADDING - top), text, font=font, fill=(0, 0, 0, 255))
+    return image
+
+
+def digest(*parts):
+    return hashlib.blake2b("\0".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+
+class SampleCache:
+    # Font samples rendered with Pillow and kept on disk between runs. Each
+    # sample text and size gets a folder of its own, and the file name
+    # hashes the font path and its mtime, so an updated font or a new
+    # sample text never reads a stale bitmap. prune() drops the folders of
+    # every other text.
+    def __init__(self, directory=None):
+        self.directory = directory or os.path.join(cache_dir(), "fonts", "samples")
+        os.makedirs(self.directory, exist_ok=True)
+
+    def text_dir(self, text, size):
+        return os.path.join(self.directory, digest(text, str(size)))
+
+    def path(self, font_path, text, size):
+        mtime = os.stat(font_path).st_mtime_ns
+        return os.path.join(self.text_dir(text, size), digest(font_path, str(mtime)) + ".png")
+
+    def prune(self, text, size):
+        keep = os.path.basename(self.text_dir(text, size))
+        try:
+            names = os.listdir(self.directory)
+        except OSError as e:
+            log.warning("cannot list font samples %s: %s", self.directory, e)
+            return
+        for name in names:
+            if name != keep:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def sample(self, font_path, text, size):
+        # Returns None for fonts Pillow cannot read.
+        try:
+            path = self.path(font_path, text, size)
+        except OSError as e:
+            log.info("cannot render %s: %s", font_path, e)
+            return None
+        try:
+            with Image.open(path) as cached:
+                return cached.convert("RGBA")
+        except OSError:
+            pass
+        try:
+            image = render_sample(font_path, text, size)
+        except OSError as e:
+            log.info("cannot render %s: %s", font_path, e)
+            return None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with atomic_write(path, "wb") as f:
+                image.save(f, "PNG")
+        except OSError as e:
+            log.info("cannot cache the sample of %s: %s", font_path, e)
+        return image
+
+
+class Prefetcher:
+    # Fills the sample cache for a list of fonts on one background thread,
+    # in list order. Starting a new run (the sample text changed, say) ends
+    # the previous one at its next font.
+    def __init__(self, cache):
+        self.cache = cache
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def start(self, jobs):
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+        threading.Thread(target=self.run, args=(generation, list(jobs)), name="Prefetcher", daemon=True).start()
+
+    def stop(self):
+        with self.lock:
+            self.generation += 1
+
+    def run(self, generation, jobs):
+        for font_path, text, size in jobs:
+            if generation != self.generation:
+                return
+            self.cache.sample(font_path, text, size)
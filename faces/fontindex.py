@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import struct
+from storage import atomic_write, cache_path
+
+INDEX_VERSION = 1
+LAST_SELECTION = ""
+# OS/2 ulUnicodeRange bits that stand for a whole script.
+SCRIPT_BITS = {
+    "latin": 0, "greek": 7, "cyrillic": 9, "armenian": 10, "hebrew": 11, "arabic": 13, "devanagari": 15,
+    "thai": 24, "georgian": 26, "kana": 49, "hangul": 56, "cjk": 59,
+}
+WEIGHT_NAMES = {
+    100: "thin", 200: "extralight", 300: "light", 400: "regular", 500: "medium", 600: "semibold",
+    700: "bold", 800: "extrabold", 900: "black",
+}
+
+log = logging.getLogger(__name__)
+
+
+def read_tables(f, offset=0):
+    f.seek(offset)
+    tag = f.read(4)
+    if tag == b"ttcf":
+        # A collection: the first font stands for the file.
+        f.seek(offset + 12)
+        return read_tables(f, struct.unpack(">I", f.read(4))[0])
+    num_tables = struct.unpack(">H", f.read(2))[0]
+    f.seek(offset + 12)
+    tables = {}
+    for _ in range(num_tables):
+        tag, _, table_offset, length = struct.unpack(">4sIII", f.read(16))
+        tables[tag] = (table_offset, length)
+    return tables
+
+
+def read_table(f, tables, tag, size):
+    if tag not in tables or tables[tag][1] < size:
+        return None
+    f.seek(tables[tag][0])
+    return f.read(size)
+
+
+def read_font_info(path):
+    # Weight, italic and Unicode ranges, straight from the OS/2 and head
+    # tables; only a few hundred bytes are read.
+    with open(path, "rb") as f:
+        tables = read_tables(f)
+        os2 = read_table(f, tables, b"OS/2", 64)
+        head = read_table(f, tables, b"head", 46)
+    weight, ranges, italic = 400, (0, 0, 0, 0), False
+    if os2 is not None:
+        weight = struct.unpack_from(">H", os2, 4)[0]
+        ranges = struct.unpack_from(">IIII", os2, 42)
+        italic = bool(struct.unpack_from(">H", os2, 62)[0] & 1)
+    elif head is not None:
+        italic = bool(struct.unpack_from(">H", head, 44)[0] & 2)
+    return {"weight": weight, "italic": italic, "ranges": list(ranges)}
+
+
+def weight_name(weight):
+    return WEIGHT_NAMES[min(max(int(round(weight / 100.0)) * 100, 100), 900)]
+
+
+def scripts(ranges):
+    bits = 0
+    for i, value in enumerate(ranges):
+        bits |= value << (32 * i)
+    return [script for script, bit in SCRIPT_BITS.items() if bits >> bit & 1]
+
+
+def read_faces(faces, cache_file=None):
+    # {path: info} for every face, read once per file and kept on disk
+    # keyed by mtime, like the part registry.
+    cache_file = cache_file or cache_path("fonts", "index.json")
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        known = cached["files"] if cached.get("version") == INDEX_VERSION else {}
+    except (OSError, ValueError, KeyError):
+        known = {}
+    infos = {}
+    for family, style, path in faces:
+        if path in infos:
+            continue
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            info = known.get(path)
+            if info is None or info["mtime"] != mtime:
+                info = dict(read_font_info(path), mtime=mtime)
+        except (OSError, struct.error) as e:
+            log.info("skipping %s: %s", path, e)
+            continue
+        infos[path] = info
+    if infos != known:
+        try:
+            with atomic_write(cache_file) as f:
+                json.dump({"version": INDEX_VERSION, "files": infos}, f, separators=(",", ":"))
+        except OSError as e:
+            log.warning("cannot write font index %s: %s", cache_file, e)
+    return infos
+
+
+class FontIndex:
+    # Search over the installed families: every query is a pass over
+    # precomputed lower-case names plus set intersections for the
+    # attributes, so a few thousand fonts filter in about a millisecond.
+    def __init__(self, families, faces=(), infos=None):
+        self.families = list(families)
+        self.names = [(family, family.lower()) for family in self.families]
+        self.weights = {}
+        self.italic = set()
+        self.by_script = {}
+        infos = infos or {}
+        for family, style, path in faces:
+            info = infos.get(path)
+            if info is None:
+                continue
+            self.weights.setdefault(weight_name(info["weight"]), set()).add(family)
+            if info["italic"]:
+                self.italic.add(family)
+            for script in scripts(info["ranges"]):
+                self.by_script.setdefault(script, set()).add(family)
+
+    def scripts(self):
+        return [script for script in SCRIPT_BITS if script in self.by_script]
+
+    def weight_names(self):
+        return [name for name in WEIGHT_NAMES.values() if name in self.weights]
+
+    def search(self, text="", script=None, weight=None, italic=None, among=None):
+        # Every word of text must occur in the family name; names starting
+        # with the text come first. The other arguments narrow the result
+        # to families with that script, a face of that weight, an italic
+        # face, or to the given set.
+        allowed = None
+        for subset in (among, self.by_script.get(script, set()) if script else None,
+                       self.weights.get(weight, set()) if weight else None,
+                       self.italic if italic else None):
+            if subset is not None:
+                allowed = set(subset) if allowed is None else allowed & subset
+        words = text.lower().split()
+        names = self.names if allowed is None else [item for item in self.names if item[0] in allowed]
+        for word in words:
+            names = [item for item in names if word in item[1]]
+        if not words:
+            return [family for family, name in names]
+        return ([family for family, name in names if name.startswith(words[0])] +
+                [family for family, name in names if not name.startswith(words[0])])
+
+
+class SelectionSets:
+    # Named shortlists of families, saved in the cache folder. The set
+    # under LAST_SELECTION is the selection the gallery was closed with.
+    def __init__(self, path=None):
+        self.path = path or cache_path("fonts", "selections.json")
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.sets = json.load(f)
+        except (OSError, ValueError):
+            self.sets = {}
+
+    def names(self):
+        return sorted(name for name in self.sets if name != LAST_SELECTION)
+
+    def get(self, name):
+        return self.sets.get(name)
+
+    def put(self, name, families):
+        self.sets[name] = sorted(families)
+        self.save()
+
+    def save(self):
+        try:
+            with atomic_write(self.path) as f:
+                json.dump(self.sets, f, ensure_ascii=False, indent=1)
+        except OSError as e:
+            log.warning("cannot save font selections %s: %s", self.path, e)
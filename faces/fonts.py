@@ -1,98 +1,349 @@
 # -*- coding: utf-8 -*-
 import tkinter as tk
-from tkinter import font
+from collections import OrderedDict
+from tkinter import font, simpledialog
+from PIL import ImageTk
+from fontcache import Prefetcher, SampleCache, font_faces, font_files
+from fontindex import LAST_SELECTION, FontIndex, SelectionSets, read_faces
+from scheduler import TkFrameScheduler
+from workers import BackgroundLoader, TkDispatcher
+
+SAMPLE_TEXT = "Onegin.ai"
+SAMPLE_SIZE = 32
+SAMPLE_DELAY_MS = 300
+SEARCH_DELAY_MS = 50
+ANY_SCRIPT = "any script"
+ANY_WEIGHT = "any weight"
+ROW_HEIGHT = 64
+SCROLL_ROWS = 3
+PHOTO_LIMIT = 512
+# Rows rendered ahead of the view (and half as many behind it).
+PREFETCH_ROWS = 200
+
+
+class FontRow:
+    # One recycled row of the gallery: a checkbutton, the sample and the
+    # family name. Only as many rows exist as fit in the viewport.
+    def __init__(self, viewer):
+        self.viewer = viewer
+        self.name = None
+        self.requested = None
+        self.var = tk.BooleanVar(value=True)
+        self.frame = tk.Frame(viewer.canvas, height=ROW_HEIGHT)
+        self.checkbutton = tk.Checkbutton(self.frame, text="", variable=self.var, onvalue=True, offvalue=False,
+                                          command=self.on_toggle)
+        self.sample_label = tk.Label(self.frame)
+        self.name_label = tk.Label(self.frame, font=("Arial", 12))
+        self.checkbutton.pack(side=tk.LEFT, padx=10)
+        self.sample_label.pack(side=tk.LEFT, padx=10)
+        self.name_label.pack(side=tk.LEFT, padx=10)
+        self.item = viewer.canvas.create_window(0, 0, window=self.frame, anchor=tk.NW, state=tk.HIDDEN)
+
+    def show(self, name, y):
+        if name != self.name:
+            self.name = name
+            self.name_label.config(text=name)
+        self.viewer.show_sample(self)
+        self.var.set(self.viewer.selected[name])
+        self.viewer.canvas.coords(self.item, 0, y)
+        self.viewer.canvas.itemconfig(self.item, state=tk.NORMAL)
+
+    def hide(self):
+        self.viewer.canvas.itemconfig(self.item, state=tk.HIDDEN)
+
+    def on_toggle(self):
+        self.viewer.selected[self.name] = self.var.get()
+
 
 class FontViewer(tk.Tk):
     def __init__(self):
         super().__init__()
         self.title("Font Viewer")
 
+        self.fonts = list(dict.fromkeys(font.families()))
+        # Selection lives in a plain dict; rows only mirror it while shown.
+        # The selection the gallery was last closed with comes back.
+        self.selection_sets = SelectionSets()
+        last = self.selection_sets.get(LAST_SELECTION)
+        last = set(last) if last is not None else None
+        self.selected = {font_name: last is None or font_name in last for font_name in self.fonts}
+        self.selected_only = False
+        # Names are searchable at once; script and weight arrive with the
+        # font files.
+        self.index = FontIndex(self.fonts)
+        self.shown = self.fonts
+        self.rows = []
+
+        # Samples are rendered by Pillow off the UI thread and cached on
+        # disk; until the font files are known Tk draws them itself.
+        self.sample_text = SAMPLE_TEXT
+        self.sample_pixels = int(round(SAMPLE_SIZE * self.winfo_fpixels("1i") / 72))
+        self.font_files = None
+        self.photos = OrderedDict()
+        self.samples = SampleCache()
+        self.prefetcher = Prefetcher(self.samples)
+        self.prefetch_first = None
+        self.dispatcher = TkDispatcher(self)
+        self.loader = BackgroundLoader(self.dispatcher.post)
+        self.frames = TkFrameScheduler(self)
+
+        #  
+        self.master_var = tk.BooleanVar(value=True)
+        self.toolbar = tk.Frame(self)
+        self.toolbar.pack(side=tk.TOP, fill=tk.X)
+        self.master_checkbutton = tk.Checkbutton(self.toolbar, text="Select all", variable=self.master_var, command=self.toggle_all_fonts)
+        self.master_checkbutton.pack(side=tk.LEFT, padx=10, pady=10)
+
+        #   
+        self.search_var = tk.StringVar()
+        self.search_entry = tk.Entry(self.toolbar, textvariable=self.search_var, font=("Arial", 12))
+        self.search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=10)
+        self.script_var = tk.StringVar(value=ANY_SCRIPT)
+        self.script_menu = tk.OptionMenu(self.toolbar, self.script_var, ANY_SCRIPT)
+        self.script_menu.pack(side=tk.LEFT)
+        self.weight_var = tk.StringVar(value=ANY_WEIGHT)
+        self.weight_menu = tk.OptionMenu(self.toolbar, self.weight_var, ANY_WEIGHT)
+        self.weight_menu.pack(side=tk.LEFT)
+        self.italic_var = tk.BooleanVar(value=False)
+        self.italic_checkbutton = tk.Checkbutton(self.toolbar, text="Italic", variable=self.italic_var,
+                                                 command=self.apply_filter)
+        self.italic_checkbutton.pack(side=tk.LEFT)
+        self.search_var.trace_add("write", self.on_search_edited)
+        self.script_var.trace_add("write", self.on_search_edited)
+        self.weight_var.trace_add("write", self.on_search_edited)
+
+        #   
+        self.save_set_button = tk.Button(self.toolbar, text="Save set", command=self.save_selection)
+        self.save_set_button.pack(side=tk.LEFT, padx=10)
+        self.sets_button = tk.Menubutton(self.toolbar, text="Sets", relief=tk.RAISED)
+        self.sets_menu = tk.Menu(self.sets_button, tearoff=False, postcommand=self.fill_sets_menu)
+        self.sets_button.config(menu=self.sets_menu)
+        self.sets_button.pack(side=tk.LEFT, padx=10)
+
+        #  
+        self.sample_var = tk.StringVar(value=SAMPLE_TEXT)
+        self.sample_entry = tk.Entry(self, textvariable=self.sample_var, font=("Arial", 12))
+        self.sample_entry.pack(side=tk.TOP, fill=tk.X, padx=10)
+        self.sample_var.trace_add("write", self.on_sample_edited)
+
+        #      
+        self.filter_button = tk.Button(self, text="Selected", command=self.filter_fonts)
+        self.filter_button.pack(side=tk.BOTTOM, pady=10)
+
+        #     
+        self.show_all_button = tk.Button(self, text="Show all", command=self.show_all_fonts)
+        self.show_all_button.pack(side=tk.BOTTOM)
+
         #     
         self.frame = tk.Frame(self)
         self.frame.pack(fill=tk.BOTH, expand=True)
 
         #   
-        self.canvas = tk.Canvas(self.frame, width=800, height=600)
-        self.scrollbar = tk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.canvas.yview)
+        self.canvas = tk.Canvas(self.frame, width=800, height=600, yscrollincrement=ROW_HEIGHT)
+        self.scrollbar = tk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.yview)
         self.canvas.configure(yscrollcommand=self.scrollbar.set)
 
         #       
         self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-        #       
-        self.canvas_frame = tk.Frame(self.canvas)
-        self.canvas.create_window((0, 0), window=self.canvas_frame, anchor=tk.NW)
-
         #    
-        self.bind("<Configure>", self.on_resize)
+        self.canvas.bind("<Configure>", self.on_resize)
+        self.bind_all("<MouseWheel>", self.on_mousewheel)
+        self.bind_all("<Button-4>", lambda event: self.yview("scroll", -SCROLL_ROWS, "units"))
+        self.bind_all("<Button-5>", lambda event: self.yview("scroll", SCROLL_ROWS, "units"))
 
-        self.fonts = font.families()
-        self.font_vars = {}
-        self.checkbuttons = []
-
-        #   
-        self.master_var = tk.BooleanVar(value=True)
-        self.master_checkbutton = tk.Checkbutton(self.canvas_frame, text="Select all", variable=self.master_var, command=self.toggle_all_fonts)
-        self.master_checkbutton.grid(row=0, column=0, padx=10, pady=10, sticky=tk.W)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
 
-        self.create_font_list()
         self.show_all_fonts()
+        self.loader.submit("catalog", self.load_catalog, self.on_catalog, self.on_catalog_failed)
 
-        #      
-        self.filter_button = tk.Button(self, text="Selected", command=self.filter_fonts)
-        self.filter_button.pack(side=tk.BOTTOM, pady=10)
+    def create_font_list(self):
+        # The scroll region covers every shown font, but widgets exist only
+        # for the rows in view; update_rows() moves them as the list scrolls.
+        self.canvas.config(scrollregion=(0, 0, self.canvas.winfo_width(), len(self.shown) * ROW_HEIGHT))
+        self.canvas.yview_moveto(0)
+        self.prefetch_first = None
+        self.update_rows()
+        if self.font_files:
+            self.prefetch()
 
-        #     
-        self.show_all_button = tk.Button(self, text="Show all", command=self.show_all_fonts)
-        self.show_all_button.pack(side=tk.BOTTOM)
+    def update_rows(self):
+        height = max(self.canvas.winfo_height(), ROW_HEIGHT)
+        needed = height // ROW_HEIGHT + 2
+        while len(self.rows) < needed:
+            self.rows.append(FontRow(self))
+        first = int(self.canvas.canvasy(0)) // ROW_HEIGHT
+        for offset, row in enumerate(self.rows):
+            index = first + offset
+            if offset < needed and index < len(self.shown):
+                row.show(self.shown[index], index * ROW_HEIGHT)
+            else:
+                row.hide()
+        if self.font_files and self.prefetch_first is not None:
+            if abs(first - self.prefetch_first) >= PREFETCH_ROWS // 2:
+                self.prefetch()
 
-    def create_font_list(self):
-        y_position = 1
-        for font_name in self.fonts:
-            var = tk.BooleanVar(value=True)
-            self.font_vars[font_name] = var
+    def show_sample(self, row):
+        photo = self.photos.get(row.name)
+        if photo is not None:
+            self.photos.move_to_end(row.name)
+            row.sample_label.config(image=photo, text="")
+        elif self.font_files is None or row.name not in self.font_files:
+            row.sample_label.config(image="", text=self.sample_text, font=(row.name, SAMPLE_SIZE))
+        else:
+            row.sample_label.config(image="", text="")
+            self.request_sample(row)
+
+    def request_sample(self, row):
+        # One request per row: a row recycled for another font supersedes
+        # its pending request, so scrolling fast only renders what stops
+        # in view.
+        name, text, size = row.name, self.sample_text, self.sample_pixels
+        if row.requested == (name, text):
+            return
+        row.requested = (name, text)
+        path = self.font_files[name]
+        self.loader.submit(row, lambda: self.samples.sample(path, text, size),
+                           lambda image: self.on_sample_loaded(name, text, image),
+                           lambda error: self.on_sample_loaded(name, text, None))
+
+    def on_sample_loaded(self, name, text, image):
+        if text != self.sample_text:
+            return
+        if image is None:
+            # Pillow cannot read this font; Tk draws it instead.
+            self.font_files.pop(name, None)
+        else:
+            self.photos[name] = ImageTk.PhotoImage(image)
+            while len(self.photos) > PHOTO_LIMIT:
+                self.photos.popitem(last=False)
+        for row in self.rows:
+            if row.name == name:
+                self.show_sample(row)
+
+    def load_catalog(self):
+        # Runs on a worker: lists the font files and reads their tables.
+        faces = font_faces()
+        return font_files(faces), FontIndex(self.fonts, faces, read_faces(faces))
+
+    def on_catalog(self, catalog):
+        self.font_files, self.index = catalog
+        self.fill_option_menu(self.script_menu, self.script_var, [ANY_SCRIPT] + self.index.scripts())
+        self.fill_option_menu(self.weight_menu, self.weight_var, [ANY_WEIGHT] + self.index.weight_names())
+        for row in self.rows:
+            row.requested = None
+        self.update_rows()
+        self.prefetch()
+        self.prune_samples()
+
+    def on_catalog_failed(self, error):
+        # Without the font files every sample is drawn by Tk; searching by
+        # name still works.
+        self.font_files = {}
+        self.update_rows()
+
+    def prefetch(self):
+        # The rows in view were requested first; a window around them is
+        # rendered into the disk cache from there on, and moves along once
+        # the list has scrolled half of it away.
+        first = int(self.canvas.canvasy(0)) // ROW_HEIGHT
+        self.prefetch_first = first
+        names = self.shown[first:first + PREFETCH_ROWS] + self.shown[max(0, first - PREFETCH_ROWS // 2):first][::-1]
+        self.prefetcher.start((self.font_files[name], self.sample_text, self.sample_pixels)
+                              for name in names if name in self.font_files)
 
-            #     
-            text_label = tk.Label(self.canvas_frame, text="Onegin.ai", font=(font_name, 32))  #     2 
-            font_name_label = tk.Label(self.canvas_frame, text=font_name, font=("Arial", 12))
-            checkbutton = tk.Checkbutton(self.canvas_frame, text="", variable=var, onvalue=True, offvalue=False)
+    def prune_samples(self):
+        # Samples of every other text are deleted off the UI thread.
+        text, size = self.sample_text, self.sample_pixels
+        self.loader.submit("prune", lambda: self.samples.prune(text, size), lambda result: None)
 
-            text_label.grid(row=y_position, column=1, sticky=tk.W, padx=10, pady=5)
-            font_name_label.grid(row=y_position, column=2, sticky=tk.W, padx=10, pady=5)
-            checkbutton.grid(row=y_position, column=0, padx=10, pady=5)
+    def on_sample_edited(self, *args):
+        self.frames.debounce("sample", self.on_sample_text, SAMPLE_DELAY_MS)
 
-            self.checkbuttons.append((font_name, text_label, font_name_label, checkbutton))
-            y_position += 1  #   y
+    def on_sample_text(self):
+        text = self.sample_var.get()
+        if text == self.sample_text:
+            return
+        self.sample_text = text
+        self.photos.clear()
+        for row in self.rows:
+            row.requested = None
+        self.update_rows()
+        if self.font_files is not None:
+            self.prefetch()
+            self.prune_samples()
 
-        #   
-        self.canvas.update_idletasks()
-        self.canvas.config(scrollregion=self.canvas.bbox("all"))
+    def on_close(self):
+        self.selection_sets.put(LAST_SELECTION, [font_name for font_name, selected in self.selected.items() if selected])
+        self.prefetcher.stop()
+        self.frames.stop()
+        self.loader.shutdown()
+        self.dispatcher.stop()
+        self.destroy()
+
+    def yview(self, *args):
+        self.canvas.yview(*args)
+        self.update_rows()
+
+    def on_mousewheel(self, event):
+        self.yview("scroll", -SCROLL_ROWS if event.delta > 0 else SCROLL_ROWS, "units")
 
     def on_resize(self, event):
-        self.canvas.config(scrollregion=self.canvas.bbox("all"))
+        self.canvas.config(scrollregion=(0, 0, event.width, len(self.shown) * ROW_HEIGHT))
+        self.update_rows()
+
+    def fill_option_menu(self, option_menu, var, values):
+        menu = option_menu["menu"]
+        menu.delete(0, tk.END)
+        for value in values:
+            menu.add_command(label=value, command=lambda value=value: var.set(value))
+
+    def on_search_edited(self, *args):
+        self.frames.debounce("search", self.apply_filter, SEARCH_DELAY_MS)
+
+    def apply_filter(self):
+        # Only the rows in view are touched, whatever the size of the result.
+        script = self.script_var.get()
+        weight = self.weight_var.get()
+        among = {font_name for font_name, selected in self.selected.items() if selected} if self.selected_only else None
+        self.shown = self.index.search(self.search_var.get(), None if script == ANY_SCRIPT else script,
+                                       None if weight == ANY_WEIGHT else weight, self.italic_var.get(), among)
+        self.create_font_list()
 
     def filter_fonts(self):
-        for font_name, text_label, font_name_label, checkbutton in self.checkbuttons:
-            if self.font_vars[font_name].get():
-                text_label.grid()
-                font_name_label.grid()
-                checkbutton.grid()
-            else:
-                text_label.grid_remove()
-                font_name_label.grid_remove()
-                checkbutton.grid_remove()
+        self.selected_only = True
+        self.apply_filter()
 
     def show_all_fonts(self):
-        for font_name, text_label, font_name_label, checkbutton in self.checkbuttons:
-            text_label.grid()
-            font_name_label.grid()
-            checkbutton.grid()
+        self.selected_only = False
+        self.search_var.set("")
+        self.script_var.set(ANY_SCRIPT)
+        self.weight_var.set(ANY_WEIGHT)
+        self.italic_var.set(False)
+        self.frames.cancel("search")
+        self.apply_filter()
+
+    def save_selection(self):
+        name = simpledialog.askstring("Save set", "Name of the set:", parent=self)
+        if name:
+            self.selection_sets.put(name, [font_name for font_name, selected in self.selected.items() if selected])
+
+    def fill_sets_menu(self):
+        self.sets_menu.delete(0, tk.END)
+        for name in self.selection_sets.names():
+            self.sets_menu.add_command(label=name, command=lambda name=name: self.open_selection(name))
+
+    def open_selection(self, name):
+        families = set(self.selection_sets.get(name) or ())
+        for font_name in self.fonts:
+            self.selected[font_name] = font_name in families
+        self.filter_fonts()
 
     def toggle_all_fonts(self):
         all_checked = self.master_var.get()
-        for font_name, _, _, checkbutton in self.checkbuttons:
-            self.font_vars[font_name].set(all_checked)
+        for font_name in self.fonts:
+            self.selected[font_name] = all_checked
         self.filter_fonts()
 
     def run(self):
@@ -100,4 +351,4 @@ class FontViewer(tk.Tk):
 
 if __name__ == "__main__":
     app = FontViewer()
-    app.run()
\ No newline at end of file
+    app.run()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import math
+
+PHI = (1 + math.sqrt(5)) / 2
+# PHI ** -i, enough for every task the trainers set.
+INVERSE_POWERS = tuple(PHI ** -i for i in range(16))
+
+
+def inverse_power(i):
+    return INVERSE_POWERS[i] if 0 <= i < len(INVERSE_POWERS) else PHI ** -i
+
+
+def golden_lengths(length, count, first=0):
+    # length / PHI ** i for i = first, first + 1, ...: a chain of lengths in
+    # golden proportion, each PHI times shorter than the one before.
+    return tuple(length * inverse_power(i) for i in range(first, first + count))
+
+
+def golden_cuts(length, count, first=1):
+    # Distances from the start of a line to the points length * (1 - PHI ** -i).
+    # Cutting the rest of a line in golden proportion again and again lands
+    # on exactly these points, so no loop over the previous cuts is needed.
+    return tuple(length * (1 - inverse_power(i)) for i in range(first, first + count))
+
+
+def ratio_accuracy(ratio, ideal=PHI):
+    # 100 for the ideal ratio, less the further off it is, either way.
+    return min(ratio / ideal, ideal / ratio) * 100
+
+
+class Segment:
+    # A line from start to end with its length and direction worked out
+    # once, so that points along it and hit tests are plain arithmetic.
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.length = math.hypot(end[0] - start[0], end[1] - start[1])
+        self.ux = (end[0] - start[0]) / self.length if self.length else 1.0
+        self.uy = (end[1] - start[1]) / self.length if self.length else 0.0
+
+    def point_at(self, distance):
+        return (self.start[0] + self.ux * distance, self.start[1] + self.uy * distance)
+
+    def points_at(self, distances):
+        return [self.point_at(distance) for distance in distances]
+
+    def along(self, point):
+        # Distance from start to the projection of point onto the line.
+        return (point[0] - self.start[0]) * self.ux + (point[1] - self.start[1]) * self.uy
+
+    def across(self, point):
+        return abs((point[1] - self.start[1]) * self.ux - (point[0] - self.start[0]) * self.uy)
+
+    def contains(self, point, slack):
+        # True when going to point and on to end is less than slack longer
+        # than the line itself: a thin ellipse around the segment.
+        d1 = math.hypot(point[0] - self.start[0], point[1] - self.start[1])
+        d2 = math.hypot(self.end[0] - point[0], self.end[1] - point[1])
+        return d1 + d2 - self.length < slack
+
+    def reach(self, slack):
+        # How far from the segment contains(point, slack) can still be true:
+        # the half minor axis of that ellipse.
+        return math.sqrt(slack * (2 * self.length + slack)) / 2
+
+    def moved(self, dx, dy):
+        return Segment((self.start[0] + dx, self.start[1] + dy), (self.end[0] + dx, self.end[1] + dy))
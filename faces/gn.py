@@ -1,13 +1,126 @@
 # -*- coding: utf-8 -*-
 import sys
 import os
-from PyQt5.QtWidgets import QApplication, QMainWindow, QLabel, QGraphicsView, QGraphicsScene, QVBoxLayout, QWidget, QGraphicsPixmapItem
-from PyQt5.QtGui import QPixmap, QImage, QPainter
-from PyQt5.QtCore import Qt, QPointF, QEvent
+import argparse
+import logging
+from PyQt5.QtWidgets import QApplication, QMainWindow, QLabel, QGraphicsView, QGraphicsScene, QVBoxLayout, QWidget, QGraphicsPixmapItem, QListView, QShortcut
+from PyQt5.QtGui import QPixmap, QImage, QPainter, QColor, QKeySequence
+from PyQt5.QtCore import Qt, QPointF, QEvent, QObject, QSize, QTimer, QAbstractListModel, QModelIndex, pyqtSignal
+from assetpack import open_library
+from instrument import METRICS, OVERLAY_KEY, OVERLAY_MS, timed
+
+from scheduler import FRAME_MS, FrameScheduler
+from thumbnails import THUMBNAIL_SIZE, ThumbnailCache
+from watcher import watch_folders
+from workers import BackgroundLoader
+
+PLACEHOLDER_COLOR = QColor(200, 200, 200, 96)
+STRIP_MARGIN = 24
+STRIP_SYNC_MS = 50
+
+def to_qimage(image):
+    img = QImage(image.tobytes(), image.width, image.height, image.width * 4, QImage.Format_RGBA8888)
+    return img.copy()
+
+class MainThreadDispatcher(QObject):
+    # Emitting from a worker thread queues the call onto the GUI thread,
+    # which is the only place QPixmap may be created.
+    posted = pyqtSignal(object)
 
-class ImageViewer(QMainWindow):
     def __init__(self):
         super().__init__()
+        self.posted.connect(self.run)
+
+    def post(self, fn):
+        self.posted.emit(fn)
+
+    def run(self, fn):
+        fn()
+
+class QtFrameScheduler(FrameScheduler):
+    def __init__(self, parent, frame_ms=FRAME_MS):
+        super().__init__(frame_ms)
+        self.timer = QTimer(parent)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.tick)
+
+    def arm(self, ms):
+        self.timer.start(ms)
+
+    def stop(self):
+        super().stop()
+        self.timer.stop()
+        self.armed = None
+
+class ThumbnailModel(QAbstractListModel):
+    # The list view only asks for the rows it is about to paint, so
+    # thumbnails are generated lazily for the visible cells.
+    def __init__(self, viewer):
+        super().__init__(viewer)
+        self.viewer = viewer
+        self.pixmaps = {}
+        self.requested = set()
+        self.placeholder = QPixmap(*THUMBNAIL_SIZE)
+        self.placeholder.fill(PLACEHOLDER_COLOR)
+
+    def reset(self):
+        self.beginResetModel()
+        self.pixmaps.clear()
+        self.requested.clear()
+        self.endResetModel()
+
+    def remap(self, rows):
+        # rows maps old row numbers to new ones for files that did not
+        # change; their thumbnails move along, the rest are built again.
+        self.beginResetModel()
+        for row in self.requested - set(self.pixmaps):
+            self.viewer.loader.cancel(("thumbnail", row))
+        self.pixmaps = {rows[row]: pixmap for row, pixmap in self.pixmaps.items() if row in rows}
+        self.requested = set(self.pixmaps)
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.viewer.images)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        if role == Qt.DecorationRole:
+            pixmap = self.pixmaps.get(row)
+            if pixmap is None:
+                self.request(row)
+                return self.placeholder
+            return pixmap
+        if role == Qt.ToolTipRole:
+            return self.viewer.images[row][0]
+        return None
+
+    def request(self, row):
+        if row in self.requested:
+            return
+        self.requested.add(row)
+        self.viewer.loader.submit(("thumbnail", row), lambda: self.viewer.decode_thumbnail(row),
+                                  lambda img: self.on_thumbnail_loaded(row, img),
+                                  lambda error: self.on_thumbnail_failed(row))
+
+    def on_thumbnail_loaded(self, row, img):
+        self.pixmaps[row] = QPixmap.fromImage(img)
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+    def on_thumbnail_failed(self, row):
+        # An empty pixmap: no decoration, and no new request for the row.
+        self.pixmaps[row] = QPixmap()
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+class ImageViewer(QMainWindow):
+    def __init__(self, faces_root=None, part="hair", pack_path=None):
+        super().__init__()
+        self.faces_root = faces_root
+        self.part = part
+        self.pack_path = pack_path
         self.initUI()
         self.load_images()
         self.display_current_image()
@@ -31,106 +144,280 @@ class ImageViewer(QMainWindow):
         self.view.viewport().installEventFilter(self)
 
         self.scene = QGraphicsScene(self)
+        # Items are only ever shown, hidden or dragged; keeping a BSP index
+        # up to date for that costs more than it saves when painting.
+        self.scene.setItemIndexMethod(QGraphicsScene.NoIndex)
         self.view.setScene(self.scene)
 
+        self.thumbnail_model = ThumbnailModel(self)
+        self.strip = QListView(self)
+        self.strip.setViewMode(QListView.IconMode)
+        self.strip.setFlow(QListView.LeftToRight)
+        self.strip.setWrapping(False)
+        self.strip.setMovement(QListView.Static)
+        self.strip.setUniformItemSizes(True)
+        self.strip.setIconSize(QSize(*THUMBNAIL_SIZE))
+        self.strip.setFixedHeight(THUMBNAIL_SIZE[1] + STRIP_MARGIN)
+        self.strip.setModel(self.thumbnail_model)
+        self.strip.clicked.connect(self.on_thumbnail_clicked)
+        # While the wheel is spinning the strip would repaint on every step;
+        # its highlight catches up once scrolling pauses.
+        self.strip_timer = QTimer(self)
+        self.strip_timer.setSingleShot(True)
+        self.strip_timer.setInterval(STRIP_SYNC_MS)
+        self.strip_timer.timeout.connect(self.sync_strip)
+
+        # Frame and handler timings over the view, toggled with OVERLAY_KEY.
+        self.overlay = QLabel(self.view)
+        self.overlay.setStyleSheet("background: rgba(255, 255, 255, 200); color: #c00000; font-family: monospace;")
+        self.overlay.hide()
+        self.overlay_timer = QTimer(self)
+        self.overlay_timer.setInterval(OVERLAY_MS)
+        self.overlay_timer.timeout.connect(self.refresh_overlay)
+        self.overlay_enabled = False
+        QShortcut(QKeySequence(OVERLAY_KEY), self, self.toggle_overlay)
+
         self.main_layout.addWidget(self.title_label)
         self.main_layout.addWidget(self.view)
+        self.main_layout.addWidget(self.strip)
 
-        self.folder_path = r"C:\Users\JR\hair"
+        self.parts = None
         self.images = []
         self.current_image_index = 0
-        self.image_positions = []
+        # One persistent item per variant shown so far. Switching hides the
+        # previous item and shows the next one; each item keeps its own
+        # position, so nothing is rebuilt while scrolling.
         self.image_items = {}
+        self.current_item = None
+        self.thumbnails = ThumbnailCache()
+        self.watcher = None
 
         self.is_dragging = False
         self.last_mouse_pos = None
 
+        self.dispatcher = MainThreadDispatcher()
+        self.loader = BackgroundLoader(self.dispatcher.post)
+        self.frames = QtFrameScheduler(self)
+
+    @timed
     def load_images(self):
-        for filename in os.listdir(self.folder_path):
-            if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-                img_path = os.path.join(self.folder_path, filename)
-                img = QImage(img_path)
-                pixmap = QPixmap.fromImage(img)
-                self.images.append((filename, pixmap))
-                self.image_positions.append(QPointF(self.view.width() // 2, self.view.height() // 2))
+        # Files are only listed here; each one is decoded and trimmed off the
+        # GUI thread the first time it is shown.
+        self.parts = open_library(self.faces_root, self.pack_path, [self.part])
+        for variant in self.parts.variants[self.part]:
+            self.images.append((os.path.basename(variant.path), None))
+        self.thumbnail_model.reset()
+        if self.parts.pack is None:
+            folders = {self.part: self.parts.folders[self.part]}
+            self.watcher = watch_folders(folders, lambda folder, changes: self.dispatcher.post(
+                lambda: self.on_folder_changed(changes)))
 
+    @timed
     def display_current_image(self):
-        self.scene.clear()
-        filename, pixmap = self.images[self.current_image_index]
-        item = QGraphicsPixmapItem(pixmap)
+        item = self.image_items.get(self.current_image_index)
+        if item is None:
+            item = self.create_item(self.current_image_index)
+        elif self.images[self.current_image_index][1] is None:
+            self.request_image(self.current_image_index)
+        if item is not self.current_item:
+            if self.current_item is not None:
+                self.current_item.hide()
+            item.show()
+            self.current_item = item
 
-        previous_position = self.image_positions[self.current_image_index]
-        item.setPos(previous_position)
-        
+        self.strip_timer.start()
+
+    def sync_strip(self):
+        self.strip.setCurrentIndex(self.thumbnail_model.index(self.current_image_index))
+
+    def create_item(self, index):
+        filename, pixmap = self.images[index]
+        if pixmap is None:
+            pixmap = self.placeholder(index)
+            self.request_image(index)
+        item = QGraphicsPixmapItem(pixmap)
+        item.setOffset(self.image_offset(index))
+        item.setPos(self.view.width() // 2, self.view.height() // 2)
+        item.hide()
         self.scene.addItem(item)
-        self.image_items[self.current_image_index] = item
+        self.image_items[index] = item
+        return item
+
+    def image_offset(self, index):
+        # Trimmed margins go back in as an item offset, so every image keeps
+        # its place in the original frame.
+        bbox = self.parts.variant(self.part, index).bbox
+        return QPointF(bbox[0], bbox[1])
+
+    def placeholder(self, index):
+        pixmap = QPixmap(*self.parts.variant(self.part, index).stored_size)
+        pixmap.fill(PLACEHOLDER_COLOR)
+        return pixmap
+
+    def request_image(self, index):
+        # Scrolling on supersedes the pending decode of the previous image.
+        self.loader.submit("current", lambda: self.decode_image(index), lambda img: self.on_image_loaded(index, img),
+                           lambda error: self.on_image_failed(index))
+
+    def decode_image(self, index):
+        return to_qimage(self.parts.image(self.part, index))
+
+    def decode_thumbnail(self, index):
+        return to_qimage(self.thumbnails.thumbnail(self.parts, self.part, index))
+
+    @timed
+    def on_thumbnail_clicked(self, index):
+        if index.row() != self.current_image_index:
+            self.current_image_index = index.row()
+            self.display_current_image()
+
+    @timed
+    def on_image_loaded(self, index, img):
+        filename, _ = self.images[index]
+        pixmap = QPixmap.fromImage(img)
+        self.images[index] = (filename, pixmap)
+        item = self.image_items.get(index)
+        if item is not None:
+            item.setPixmap(pixmap)
+            item.setOffset(self.image_offset(index))
+
+    def on_image_failed(self, index):
+        # The file could not be decoded; the placeholder goes away instead
+        # of waiting for an image that will not come.
+        item = self.image_items.get(index)
+        if item is not None:
+            item.setPixmap(QPixmap())
+
+    @timed
+    def on_folder_changed(self, changes):
+        # Only new and changed files are decoded again. Items of untouched
+        # variants keep their pixmaps and positions; a changed file keeps
+        # its item, so it stays where it was dragged to.
+        paths = {path for kind, path in changes}
+        old_paths = [variant.path for variant in self.parts.variants[self.part]]
+        current = old_paths[self.current_image_index] if old_paths else None
+        pixmaps = {path: pixmap for path, (filename, pixmap) in zip(old_paths, self.images) if path not in paths}
+        items = {old_paths[index]: item for index, item in self.image_items.items()}
+
+        # A decode still in flight refers to the old numbering.
+        self.loader.cancel("current")
+        variants = self.parts.refresh(self.part, paths)
+        new_index = {variant.path: variant.index for variant in variants}
+        self.images = [(os.path.basename(variant.path), pixmaps.get(variant.path)) for variant in variants]
+        self.image_items = {}
+        for path, item in items.items():
+            index = new_index.get(path)
+            if index is None:
+                self.scene.removeItem(item)
+                if item is self.current_item:
+                    self.current_item = None
+                continue
+            self.image_items[index] = item
+            if path in paths:
+                item.setPixmap(self.placeholder(index))
+                item.setOffset(self.image_offset(index))
+        self.thumbnail_model.remap({old: new_index[path] for old, path in enumerate(old_paths)
+                                    if path in new_index and path not in paths})
+
+        if not variants:
+            self.current_image_index = 0
+            if self.current_item is not None:
+                self.current_item.hide()
+                self.current_item = None
+            return
+        self.current_image_index = new_index.get(current, min(self.current_image_index, len(variants) - 1))
+        self.display_current_image()
 
+    def closeEvent(self, event):
+        if self.watcher:
+            self.watcher.stop()
+        self.loader.shutdown()
+        self.frames.stop()
+        super().closeEvent(event)
+
+    @timed
     def wheelEvent(self, event):
         if QApplication.keyboardModifiers() == Qt.ControlModifier:
-            self.zoom(event.angleDelta().y())
+            self.frames.accumulate("zoom", 1.15 if event.angleDelta().y() > 0 else 0.85, self.zoom)
         else:
-            if event.angleDelta().y() > 0:
-                self.prev_image()
-            else:
-                self.next_image()
+            self.frames.add("scroll", -1 if event.angleDelta().y() > 0 else 1, self.scroll_by)
+
+    @timed
+    def scroll_by(self, steps):
+        if self.images:
+            self.current_image_index = (self.current_image_index + steps) % len(self.images)
+            self.display_current_image()
 
+    @timed
     def next_image(self):
-        self.save_current_image_position()
         self.current_image_index += 1
         if self.current_image_index >= len(self.images):
             self.current_image_index = 0
         self.display_current_image()
 
+    @timed
     def prev_image(self):
-        self.save_current_image_position()
         self.current_image_index -= 1
         if self.current_image_index < 0:
             self.current_image_index = len(self.images) - 1
         self.display_current_image()
 
-    def save_current_image_position(self):
-        item = self.image_items.get(self.current_image_index)
-        if item:
-            self.image_positions[self.current_image_index] = item.pos()
-
+    @timed
     def resizeEvent(self, event):
-        self.center_images()
+        self.frames.debounce("resize", self.center_images)
 
     def center_images(self):
-        for i, pos in enumerate(self.image_positions):
-            offset_x = self.view.width() // 2 - pos.x()
-            offset_y = self.view.height() // 2 - pos.y()
-            self.image_positions[i] = QPointF(self.view.width() // 2, self.view.height() // 2)
-            if i in self.image_items:
-                self.image_items[i].setPos(self.image_positions[i])
+        for item in self.image_items.values():
+            item.setPos(self.view.width() // 2, self.view.height() // 2)
+
+    def toggle_overlay(self):
+        if self.overlay.isVisible():
+            self.overlay_timer.stop()
+            self.overlay.hide()
+            if not self.overlay_enabled:
+                METRICS.disable()
+        else:
+            self.overlay_enabled = METRICS.enabled
+            METRICS.enable()
+            self.refresh_overlay()
+            self.overlay.show()
+            self.overlay_timer.start()
+
+    def refresh_overlay(self):
+        self.overlay.setText("\n".join(METRICS.overlay_lines()))
+        self.overlay.adjustSize()
 
     def eventFilter(self, source, event):
-        if event.type() == QEvent.MouseButtonPress:
+        if event.type() == QEvent.Paint:
+            METRICS.frame()
+        elif event.type() == QEvent.MouseButtonPress:
             if event.button() == Qt.LeftButton:
                 self.is_dragging = True
                 self.last_mouse_pos = event.pos()
             return True
         elif event.type() == QEvent.MouseMove:
             if self.is_dragging and self.last_mouse_pos:
-                delta = event.pos() - self.last_mouse_pos
-                item = self.image_items.get(self.current_image_index)
-                if item:
-                    item.moveBy(delta.x(), delta.y())
-                self.last_mouse_pos = event.pos()
+                self.frames.latest("drag", event.pos(), self.drag_to)
             return True
         elif event.type() == QEvent.MouseButtonRelease:
             if event.button() == Qt.LeftButton:
+                self.frames.flush("drag")
                 self.is_dragging = False
                 self.last_mouse_pos = None
-                # Update the position of the image
-                item = self.image_items.get(self.current_image_index)
-                if item:
-                    self.image_positions[self.current_image_index] = item.pos()
             return True
         return super().eventFilter(source, event)
 
-    def zoom(self, delta):
-        factor = 1.15 if delta > 0 else 0.85
+    @timed
+    def drag_to(self, pos):
+        if not self.is_dragging or self.last_mouse_pos is None:
+            return
+        delta = pos - self.last_mouse_pos
+        if self.current_item:
+            self.current_item.moveBy(delta.x(), delta.y())
+        self.last_mouse_pos = pos
+
+    @timed
+    def zoom(self, factor):
         current_pos = self.view.mapToScene(self.view.viewport().rect().center())
         self.view.scale(factor, factor)
         new_pos = self.view.mapToScene(self.view.viewport().rect().center())
@@ -138,7 +425,13 @@ class ImageViewer(QMainWindow):
         self.view.translate(delta_pos.x(), delta_pos.y())
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    viewer = ImageViewer()
+    parser = argparse.ArgumentParser(description="Browse the variants of one face part.")
+    parser.add_argument("faces", nargs="?", help="directory holding one folder per part")
+    parser.add_argument("--part", default="hair", help="part folder to browse")
+    parser.add_argument("--pack", help="asset pack to read parts from")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(name)s: %(message)s")
+    app = QApplication(sys.argv[:1])
+    viewer = ImageViewer(args.faces, args.part, args.pack)
     viewer.show()
     sys.exit(app.exec_())
\ No newline at end of file
@@ -1,117 +1,427 @@
 # -*- coding: utf-8 -*-
+import argparse
+import logging
 import os
 import tkinter as tk
-from tkinter import Canvas
+import weakref
+from tkinter import Canvas, filedialog
 from PIL import Image, ImageTk
+from assetpack import open_library
+from compositor import FaceCompositor, Layer, scale_key
+from instrument import TkOverlay, timed
+from layout import Layout, PartLayout, load_layout, part_order, save_layout
+from parts import DEFAULT_CACHE_BYTES
+from recent import RecentSessions
+from scheduler import TkFrameScheduler
+from scene import CanvasScene, FlatScene
+from storage import cache_path
+from watcher import watch_folders
+from workers import BackgroundLoader, TkDispatcher
+
+log = logging.getLogger(__name__)
+
+ZOOM_STEP = 1.1
+REFINE_DELAY_MS = 120
+PLACEHOLDER_COLOR = (200, 200, 200, 96)
+AUTOSAVE_SESSION = "session.json"
 
 class ImageEditor:
-    def __init__(self, root):
+    def __init__(self, root, cache_bytes=DEFAULT_CACHE_BYTES, pack_path=None, flatten=False, faces_root=None):
         self.root = root
         self.root.title("Image Editor")
 
         #   
-        self.folders = {
-            "hair": "C:\\Users\\JR\\hair",
-            "eyes": "C:\\Users\\JR\\eyes",
-            "nose": "C:\\Users\\JR\\nose",
-            "lips": "C:\\Users\\JR\\lips"
-        }
+        self.parts = open_library(faces_root, pack_path, cache_bytes=cache_bytes)
+        self.folders = {folder: self.parts.folders[folder] for folder in part_order(self.parts.folders)}
 
         # 
         self.canvas = Canvas(root, bg="white")
         self.canvas.pack(fill=tk.BOTH, expand=True)
+        self.flatten = flatten
+        self.scene = self.create_scene()
+        self.drag_start = None
+        self.canvas_center = None
 
         #    
-        self.current_images = {folder: [] for folder in self.folders.keys()}
+        self.current_images = {folder: None for folder in self.folders.keys()}
         self.image_positions = {folder: None for folder in self.folders.keys()}
-        self.active_folder = "hair"
+        self.variant_index = {folder: 0 for folder in self.folders.keys()}
+        self.scales = {folder: 1.0 for folder in self.folders.keys()}
+        self.refine_jobs = {}
+        self.placeholders = {}
+        # Duplicate variants shown at the same scale share one PhotoImage.
+        self.photos = weakref.WeakValueDictionary()
+        self.active_folder = next(iter(self.folders), None)
+        self.compositor = FaceCompositor(self.parts)
+        self.dispatcher = TkDispatcher(self.root)
+        self.loader = BackgroundLoader(self.dispatcher.post)
+        self.frames = TkFrameScheduler(self.root)
+        self.recent = RecentSessions()
+        self.recent_photos = {}
 
         #  
+        self.scene.set_active(self.active_folder)
         self.load_images()
+        self.restore_autosave()
+        self.watcher = self.watch_parts()
 
         # 
         self.root.bind("<MouseWheel>", self.on_mousewheel)
         self.root.bind("<space>", self.on_space)
+        self.root.bind("<Left>", self.on_prev_variant)
+        self.root.bind("<Right>", self.on_next_variant)
+        self.root.bind("<Control-s>", self.export_image)
+        self.root.bind("<Control-f>", self.on_toggle_flatten)
+        self.root.bind("<Control-l>", self.save_layout)
+        self.root.bind("<Control-o>", self.open_session)
+        self.root.bind("<Control-r>", self.show_recent)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         self.canvas.bind("<Configure>", self.on_resize)
+        self.canvas.bind("<ButtonPress-1>", self.on_press)
+        self.canvas.bind("<B1-Motion>", self.on_drag)
+        self.canvas.bind("<ButtonRelease-1>", self.on_release)
+        self.overlay = TkOverlay(self.root, self.canvas)
+
+    def create_scene(self):
+        if self.flatten:
+            # One pre-composited bitmap instead of one canvas item per part,
+            # for displays where every canvas item is expensive to redraw.
+            return FlatScene(self.canvas, self.folders)
+        return CanvasScene(self.canvas)
 
+    @timed
+    def on_toggle_flatten(self, event=None):
+        self.flatten = not self.flatten
+        self.scene.clear()
+        self.scene = self.create_scene()
+        self.scene.set_active(self.active_folder)
+        for folder, entry in self.current_images.items():
+            if entry:
+                item = self.scene.add(folder)
+                self.current_images[folder] = (None, None, item)
+                self.show_variant(folder)
+        self.display_current_image()
+
+    @timed
     def load_images(self):
-        for folder, path in self.folders.items():
-            for file in os.listdir(path):
-                if file.endswith((".png", ".jpg", ".jpeg")):
-                    img_path = os.path.join(path, file)
-                    image = Image.open(img_path)
-                    photo = ImageTk.PhotoImage(image)
-                    item = self.canvas.create_image(0, 0, image=photo, anchor=tk.CENTER)
-                    self.current_images[folder].append((image, photo, item))
-                    self.canvas.itemconfig(item, state='hidden')
+        # Only the part headers were read so far; one canvas item per part
+        # is created and just the selected variant gets decoded into it.
+        for folder in self.folders:
+            if self.parts.count(folder):
+                item = self.scene.add(folder)
+                self.current_images[folder] = (None, None, item)
+                self.show_variant(folder)
 
         self.display_current_image()
 
-    def display_current_image(self):
-        for folder, images in self.current_images.items():
-            for img, photo, item in images:
-                self.canvas.itemconfig(item, state='hidden')
+    def watch_parts(self):
+        if self.parts.pack is not None:
+            return None
+        return watch_folders(self.parts.folders, lambda folder, changes: self.dispatcher.post(
+            lambda: self.on_folder_changed(folder, changes)))
 
-        for img, photo, item in self.current_images[self.active_folder]:
-            self.canvas.itemconfig(item, state='normal')
+    def on_folder_changed(self, folder, changes):
+        # Only the files that changed are read again; the composition, the
+        # other parts and the selected variant (by file) stay as they were.
+        entry = self.current_images[folder]
+        current = self.parts.variant(folder, self.variant_index[folder]).path if entry else None
+        variants = self.parts.refresh(folder, [path for kind, path in changes])
+        if not variants:
+            if entry:
+                self.loader.cancel(folder)
+                self.scene.remove(folder)
+                self.current_images[folder] = None
+                self.scene.flush()
+            return
+        index = next((variant.index for variant in variants if variant.path == current), None)
+        self.variant_index[folder] = index if index is not None else min(self.variant_index[folder], len(variants) - 1)
+        if entry is None:
+            item = self.scene.add(folder)
+            self.current_images[folder] = (None, None, item)
+            self.show_variant(folder)
+            self.display_current_image()
+        else:
+            self.show_variant(folder)
+
+    def show_variant(self, folder, draft=False):
+        index, scale = self.variant_index[folder], self.scales[folder]
+        image = self.compositor.cached(folder, index, scale)
+        if image is not None:
+            self.loader.cancel(folder)
+            self.set_layer_image(folder, image, shared=True)
+        elif draft and self.parts.cached(folder, index) is not None:
+            # A nearest-neighbour draft keeps wheel zoom within a frame; the
+            # filtered level replaces it once the wheel has been idle.
+            self.loader.cancel(folder)
+            self.set_layer_image(folder, self.compositor.draft(folder, index, scale))
+            self.schedule_refine(folder)
+        else:
+            self.set_layer_image(folder, self.placeholder(self.compositor.scaled_size(folder, index, scale)))
+            self.request_variant(folder)
+
+    def set_layer_image(self, folder, image, shared=False):
+        img, photo, item = self.current_images[folder]
+        if not self.scene.uses_photos:
+            photo = None
+        elif shared:
+            key = (self.parts.key(folder, self.variant_index[folder]), scale_key(self.scales[folder]))
+            photo = self.photos.get(key)
+            if photo is None:
+                photo = self.photos[key] = ImageTk.PhotoImage(image)
+        else:
+            photo = ImageTk.PhotoImage(image)
+        self.scene.set_image(folder, image, photo)
+        self.current_images[folder] = (image, photo, item)
+        if self.image_positions[folder] is not None:
+            self.place_layer(folder)
+        self.scene.flush()
+
+    def place_layer(self, folder):
+        x, y = self.compositor.origin(folder, self.variant_index[folder],
+                                      self.image_positions[folder], self.scales[folder])
+        self.scene.set_origin(folder, x, y)
+
+    def placeholder(self, size):
+        image = self.placeholders.get(size)
+        if image is None:
+            image = Image.new("RGBA", size, PLACEHOLDER_COLOR)
+            self.placeholders[size] = image
+        return image
+
+    def request_variant(self, folder):
+        # Decoding and resampling run on the worker pool; a newer request
+        # for the same part supersedes this one while the user browses.
+        index, scale = self.variant_index[folder], self.scales[folder]
+        self.loader.submit(folder,
+                           lambda: self.compositor.scaled(folder, index, scale),
+                           lambda image: self.on_variant_loaded(folder, index, scale, image),
+                           lambda error: self.on_variant_failed(folder, index, scale))
+
+    @timed
+    def on_variant_loaded(self, folder, index, scale, image):
+        if (index, scale) == (self.variant_index[folder], self.scales[folder]):
+            self.set_layer_image(folder, image, shared=True)
+
+    def on_variant_failed(self, folder, index, scale):
+        # The file could not be decoded (truncated, or gone since the scan);
+        # the placeholder is dropped rather than left up.
+        if (index, scale) == (self.variant_index[folder], self.scales[folder]):
+            self.set_layer_image(folder, Image.new("RGBA", (1, 1), (0, 0, 0, 0)))
+
+    def schedule_refine(self, folder):
+        job = self.refine_jobs.pop(folder, None)
+        if job is not None:
+            self.root.after_cancel(job)
+        self.refine_jobs[folder] = self.root.after(REFINE_DELAY_MS, self.refine_variant, folder)
+
+    def refine_variant(self, folder):
+        self.refine_jobs.pop(folder, None)
+        self.request_variant(folder)
+
+    def display_current_image(self):
+        for folder, entry in self.current_images.items():
+            if entry:
+                self.scene.set_visible(folder, True)
 
         self.update_image_positions()
 
+    @timed
     def update_image_positions(self):
-        hair_position = self.image_positions.get("hair")
-
-        if hair_position is None:
-            center_x = self.canvas.winfo_width() // 2
-            center_y = self.canvas.winfo_height() // 2
-            hair_position = (center_x, center_y)
-            self.image_positions["hair"] = hair_position
-        else:
-            center_x = self.canvas.winfo_width() // 2
-            center_y = self.canvas.winfo_height() // 2
-            hair_dx = center_x - hair_position[0]
-            hair_dy = center_y - hair_position[1]
-            self.image_positions["hair"] = (center_x, center_y)
+        center_x = self.canvas.winfo_width() // 2
+        center_y = self.canvas.winfo_height() // 2
 
+        # The face follows the canvas centre; dragged layers keep their
+        # offset from it.
+        if self.canvas_center is not None:
+            dx = center_x - self.canvas_center[0]
+            dy = center_y - self.canvas_center[1]
             for folder, pos in self.image_positions.items():
-                if folder != "hair" and pos is not None:
+                if pos is not None and (dx or dy):
                     x, y = pos
-                    new_x = x + hair_dx
-                    new_y = y + hair_dy
-                    self.image_positions[folder] = (new_x, new_y)
+                    self.image_positions[folder] = (x + dx, y + dy)
+        self.canvas_center = (center_x, center_y)
+
+        for folder, pos in self.image_positions.items():
+            if pos is None:
+                self.image_positions[folder] = self.canvas_center
 
-        for folder, images in self.current_images.items():
-            for img, photo, item in images:
-                new_x, new_y = self.image_positions[folder]
-                self.canvas.coords(item, new_x, new_y)
+        # Only layers whose origin actually moved reach the canvas.
+        for folder, entry in self.current_images.items():
+            if entry:
+                self.place_layer(folder)
+        self.scene.flush()
 
+    @timed
     def on_mousewheel(self, event):
+        # Zooming out by exactly 1 / ZOOM_STEP lands back on scale levels
+        # that are already in the compositor's scale cache.
+        factor = ZOOM_STEP if event.delta > 0 else 1 / ZOOM_STEP
         if event.state == 0x0008:  # Alt key is pressed
-            self.scale_images(1.1 if event.delta > 0 else 0.9, all_images=True)
+            self.frames.accumulate("zoom-all", factor, lambda factor: self.scale_images(factor, all_images=True))
         elif event.state == 0x0000:  # No modifier key
-            self.scale_images(1.1 if event.delta > 0 else 0.9, all_images=False)
+            self.frames.accumulate("zoom", factor, self.scale_images)
 
+    @timed
     def on_space(self, event):
         self.active_folder = self.next_folder()
+        self.scene.set_active(self.active_folder)
         self.display_current_image()
 
+    @timed
+    def on_prev_variant(self, event):
+        self.step_variant(-1)
+
+    @timed
+    def on_next_variant(self, event):
+        self.step_variant(1)
+
+    def step_variant(self, step):
+        count = self.parts.count(self.active_folder)
+        if count:
+            index = self.variant_index[self.active_folder]
+            self.variant_index[self.active_folder] = (index + step) % count
+            self.show_variant(self.active_folder)
+
     def scale_images(self, scale_factor, all_images=False):
         if all_images:
-            for folder, images in self.current_images.items():
+            for folder in self.folders:
                 self.scale_image_folder(folder, scale_factor)
         else:
             self.scale_image_folder(self.active_folder, scale_factor)
 
+    @timed
     def scale_image_folder(self, folder, scale_factor):
-        for i, (image, photo, item) in enumerate(self.current_images[folder]):
-            new_size = (int(image.width * scale_factor), int(image.height * scale_factor))
-            resized_image = image.resize(new_size, Image.ANTIALIAS)
-            self.current_images[folder][i] = (resized_image, ImageTk.PhotoImage(resized_image), item)
-            self.canvas.itemconfig(item, image=self.current_images[folder][i][1])
+        self.scales[folder] *= scale_factor
+        if self.current_images[folder]:
+            self.show_variant(folder, draft=True)
 
         self.update_image_positions()
 
+    @timed
     def on_resize(self, event):
-        self.update_image_positions()
+        self.frames.debounce("resize", self.update_image_positions)
+
+    @timed
+    def on_press(self, event):
+        self.drag_start = (event.x, event.y)
+
+    @timed
+    def on_drag(self, event):
+        if self.drag_start is not None:
+            self.frames.latest("drag", (event.x, event.y), self.drag_to)
+
+    @timed
+    def drag_to(self, position):
+        if self.drag_start is None or not self.current_images[self.active_folder]:
+            return
+        dx, dy = position[0] - self.drag_start[0], position[1] - self.drag_start[1]
+        self.drag_start = position
+        x, y = self.image_positions[self.active_folder]
+        self.image_positions[self.active_folder] = (x + dx, y + dy)
+        self.place_layer(self.active_folder)
+        self.scene.flush()
+
+    @timed
+    def on_release(self, event):
+        self.frames.flush("drag")
+        self.drag_start = None
+
+    def layers(self):
+        return [Layer(folder, self.variant_index[folder], self.image_positions[folder], self.scales[folder])
+                for folder in self.folders if self.current_images[folder]]
+
+    def current_layout(self):
+        center_x, center_y = self.canvas_center
+        parts = {}
+        for folder in self.folders:
+            if self.current_images[folder]:
+                x, y = self.image_positions[folder]
+                parts[folder] = PartLayout(self.variant_index[folder], (x - center_x, y - center_y),
+                                           self.scales[folder])
+        return Layout((self.canvas.winfo_width(), self.canvas.winfo_height()), parts, self.active_folder)
+
+    def restore_layout(self, layout):
+        # Variants, scales and offsets are applied directly, so a session
+        # comes back as one render per part instead of replayed zoom steps.
+        center_x, center_y = self.canvas_center
+        for folder, part in layout.parts.items():
+            if folder not in self.folders or not self.current_images[folder]:
+                continue
+            self.variant_index[folder] = part.variant % self.parts.count(folder)
+            self.scales[folder] = part.scale
+            self.image_positions[folder] = (center_x + part.offset[0], center_y + part.offset[1])
+            self.show_variant(folder)
+        if layout.active in self.folders:
+            self.active_folder = layout.active
+            self.scene.set_active(self.active_folder)
+        self.display_current_image()
+
+    def save_layout(self, event=None):
+        # Layouts drive export_faces.py, which renders every combination.
+        path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("Layout", "*.json")])
+        if path:
+            try:
+                save_layout(path, self.current_layout())
+            except OSError as e:
+                log.warning("cannot save layout %s: %s", path, e)
+                return
+            size = (self.canvas.winfo_width(), self.canvas.winfo_height())
+            self.recent.add(path, self.compositor.render(self.layers(), size))
+            self.recent_photos.pop(os.path.abspath(path), None)
+
+    def open_session(self, event=None, path=None):
+        if path is None:
+            path = filedialog.askopenfilename(filetypes=[("Layout", "*.json")])
+        if path and self.load_session(path):
+            self.recent.add(path)
+
+    def load_session(self, path):
+        try:
+            layout = load_layout(path)
+        except (OSError, ValueError, KeyError) as e:
+            log.warning("cannot open session %s: %s", path, e)
+            return False
+        self.restore_layout(layout)
+        return True
+
+    def show_recent(self, event=None):
+        paths = self.recent.entries()
+        if not paths:
+            return
+        menu = tk.Menu(self.root, tearoff=0)
+        for path in paths:
+            photo = self.recent_photos.get(path)
+            if photo is None:
+                thumbnail = self.recent.thumbnail(path)
+                if thumbnail is not None:
+                    photo = self.recent_photos[path] = ImageTk.PhotoImage(thumbnail)
+            menu.add_command(label=os.path.basename(path), image=photo, compound=tk.LEFT,
+                             command=lambda path=path: self.open_session(path=path))
+        menu.tk_popup(self.root.winfo_pointerx(), self.root.winfo_pointery())
+
+    def restore_autosave(self):
+        path = cache_path(AUTOSAVE_SESSION)
+        if os.path.exists(path):
+            self.load_session(path)
+
+    def on_close(self):
+        try:
+            save_layout(cache_path(AUTOSAVE_SESSION), self.current_layout())
+        except OSError as e:
+            log.warning("cannot save session: %s", e)
+        if self.watcher:
+            self.watcher.stop()
+        self.loader.shutdown()
+        self.frames.stop()
+        self.dispatcher.stop()
+        self.root.destroy()
+
+    @timed
+    def export_image(self, event=None):
+        path = filedialog.asksaveasfilename(defaultextension=".png", filetypes=[("PNG", "*.png")])
+        if path:
+            size = (self.canvas.winfo_width(), self.canvas.winfo_height())
+            self.compositor.render(self.layers(), size).save(path)
 
     def next_folder(self):
         folders = list(self.folders.keys())
@@ -119,6 +429,11 @@ class ImageEditor:
         return folders[next_index]
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compose a face from part images.")
+    parser.add_argument("faces", nargs="?", help="directory holding one folder per part")
+    parser.add_argument("--pack", help="asset pack to read parts from")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(name)s: %(message)s")
     root = tk.Tk()
-    editor = ImageEditor(root)
+    editor = ImageEditor(root, pack_path=args.pack, faces_root=args.faces)
     root.mainloop()
\ No newline at end of file
@@ -1,6 +1,8 @@
 import tkinter as tk
 from tkinter import messagebox
 import random
+from geometry import PHI, golden_lengths
+from instrument import TkOverlay, timed
 
 class GoldenRatioTrainer:
     def __init__(self, master):
@@ -20,38 +22,54 @@ class GoldenRatioTrainer:
         self.clear_button.pack()
         
         self.example_lines = []
+        self.example_lengths = ()
         self.training_lines = []
+        # (x1, y1, x2, y2) of every drawn line, kept so that neither the
+        # drag nor the check asks the canvas for coordinates.
+        self.training_coords = []
         self.current_line = None
+        self.current_coords = None
         
         self.generate_example_lines()
         
         self.training_canvas.bind("<Button-1>", self.start_line)
         self.training_canvas.bind("<B1-Motion>", self.draw_line)
         self.training_canvas.bind("<ButtonRelease-1>", self.end_line)
+        self.overlay = TkOverlay(master, self.training_canvas)
     
+    @timed
     def generate_example_lines(self):
         x1 = random.randint(50, 150)
-        for i in range(5):
-            length = x1 * (1.618 ** i)
+        # Each line PHI times longer than the one above it.
+        self.example_lengths = golden_lengths(x1 * PHI ** 4, 5)[::-1]
+        for i, length in enumerate(self.example_lengths):
             line = self.example_canvas.create_line(10, 30 + i*40, 10 + length, 30 + i*40, width=2)
             self.example_lines.append(line)
     
+    @timed
     def start_line(self, event):
         self.current_line = self.training_canvas.create_line(event.x, event.y, event.x, event.y)
+        self.current_coords = (event.x, event.y, event.x, event.y)
     
+    @timed
     def draw_line(self, event):
-        x, y = self.training_canvas.coords(self.current_line)[:2]
-        self.training_canvas.coords(self.current_line, x, y, event.x, event.y)
+        x, y = self.current_coords[:2]
+        self.current_coords = (x, y, event.x, event.y)
+        self.training_canvas.coords(self.current_line, *self.current_coords)
     
+    @timed
     def end_line(self, event):
         if self.current_line:
             self.training_lines.append(self.current_line)
+            self.training_coords.append(self.current_coords)
             self.current_line = None
     
+    @timed
     def clear_training(self):
         for line in self.training_lines:
             self.training_canvas.delete(line)
         self.training_lines = []
+        self.training_coords = []
     
     def check_accuracy(self):
         if len(self.training_lines) != 5:
@@ -59,16 +77,15 @@ class GoldenRatioTrainer:
             return
         
         accuracies = []
-        for i, (example_line, training_line) in enumerate(zip(self.example_lines, self.training_lines)):
-            example_length = self.example_canvas.coords(example_line)[2] - self.example_canvas.coords(example_line)[0]
-            training_length = self.training_canvas.coords(training_line)[2] - self.training_canvas.coords(training_line)[0]
+        for i, (example_length, coords) in enumerate(zip(self.example_lengths, self.training_coords)):
+            training_length = coords[2] - coords[0]
             accuracy = min(example_length, training_length) / max(example_length, training_length) * 100
             accuracies.append(accuracy)
             
             # Отображение точности рядом с каждой линией
             self.training_canvas.create_text(
-                self.training_canvas.coords(training_line)[2] + 10,
-                self.training_canvas.coords(training_line)[1],
+                coords[2] + 10,
+                coords[1],
                 text=f"{accuracy:.1f}%"
             )
         
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+import atexit
+import collections
+import contextlib
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+from storage import cache_path
+
+METRICS_ENV = "ONEGIN_METRICS"
+PROFILE_ENV = "ONEGIN_PROFILE"
+OVERLAY_KEY = "F3"
+OVERLAY_MS = 500
+REPORT_INTERVAL = 10.0
+RECENT_SAMPLES = 256
+FRAME_SAMPLES = 240
+LOG_BYTES = 1024 * 1024
+LOG_BACKUPS = 3
+PROFILE_INTERVAL = 0.005
+PROFILE_TOP = 20
+
+log = logging.getLogger("onegin.metrics")
+NULL_CONTEXT = contextlib.nullcontext()
+
+
+class TimerStats:
+    def __init__(self):
+        self.count = 0
+        self.reported = 0
+        self.recent = collections.deque(maxlen=RECENT_SAMPLES)
+
+    def add(self, seconds):
+        self.count += 1
+        self.recent.append(seconds)
+
+    def summary(self):
+        samples = sorted(self.recent)
+        return (sum(samples) / len(samples) * 1e3,
+                samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1e3,
+                samples[-1] * 1e3)
+
+
+class SamplingProfiler:
+    # Looks at the stack of one thread every few milliseconds and counts
+    # the functions found on it. Nothing in the profiled thread changes, so
+    # it can run on a live session.
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = 0
+        self.leaf = collections.Counter()
+        self.inclusive = collections.Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="SamplingProfiler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            self.leaf[self.describe(frame)] += 1
+            seen = set()
+            while frame is not None:
+                seen.add(self.describe(frame))
+                frame = frame.f_back
+            self.inclusive.update(seen)
+
+    @staticmethod
+    def describe(frame):
+        code = frame.f_code
+        return "%s:%d(%s)" % (os.path.basename(code.co_filename), code.co_firstlineno, code.co_name)
+
+    def report(self, top=PROFILE_TOP):
+        lines = ["profile: %d samples every %.0f ms" % (self.samples, self.interval * 1e3)]
+        for title, counter in (("self", self.leaf), ("total", self.inclusive)):
+            for name, count in counter.most_common(top):
+                lines.append("  %-5s %5.1f%%  %s" % (title, 100.0 * count / max(self.samples, 1), name))
+        return lines
+
+
+class Metrics:
+    # Timers, counters and frame times for the UI thread. Everything is
+    # recorded only while enabled; disabled, a timed handler costs one
+    # attribute check on top of the call. While enabled, a summary goes to
+    # a rotating log in the cache folder every REPORT_INTERVAL seconds.
+    def __init__(self, enabled=False):
+        self.enabled = False
+        self.timers = {}
+        self.counters = collections.Counter()
+        self.frames = collections.deque(maxlen=FRAME_SAMPLES)
+        self.profiler = None
+        self.handler = None
+        self.last_report = time.perf_counter()
+        # Called after every timed handler; the Tk overlay uses it to count
+        # the redraws that follow events.
+        self.on_event = None
+        if enabled:
+            self.enable()
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        self.last_report = time.perf_counter()
+        if self.handler is None:
+            try:
+                self.handler = RotatingFileHandler(cache_path("logs", "metrics.log"), maxBytes=LOG_BYTES,
+                                                   backupCount=LOG_BACKUPS, encoding="utf-8")
+            except OSError as e:
+                log.warning("cannot open the metrics log: %s", e)
+            else:
+                self.handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+                log.addHandler(self.handler)
+                log.setLevel(logging.INFO)
+                log.propagate = False
+                atexit.register(self.stop)
+        if os.environ.get(PROFILE_ENV) and self.profiler is None:
+            self.start_profiler()
+
+    def disable(self):
+        if self.enabled:
+            self.report()
+        self.enabled = False
+
+    def stop(self):
+        self.disable()
+        if self.profiler is not None:
+            self.profiler.stop()
+            for line in self.profiler.report():
+                log.info(line)
+            self.profiler = None
+
+    def start_profiler(self, thread_id=None):
+        self.profiler = SamplingProfiler(thread_id or threading.main_thread().ident).start()
+
+    def timer(self, name):
+        stats = self.timers.get(name)
+        if stats is None:
+            stats = self.timers[name] = TimerStats()
+        return stats
+
+    def record(self, name, seconds):
+        self.timer(name).add(seconds)
+        if self.on_event is not None:
+            self.on_event()
+        self.maybe_report()
+
+    def timed(self, fn):
+        name = fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return fn(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - started)
+        return wrapper
+
+    @contextlib.contextmanager
+    def timing(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def measure(self, name):
+        # For blocks inside a loop: with metrics.measure("draw"): ...
+        return self.timing(name) if self.enabled else NULL_CONTEXT
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] += n
+
+    def frame(self):
+        if self.enabled:
+            self.frames.append(time.perf_counter())
+            self.maybe_report()
+
+    def fps(self):
+        now = time.perf_counter()
+        recent = [t for t in self.frames if now - t <= 1.0]
+        if len(recent) < 2:
+            return 0.0
+        return (len(recent) - 1) / max(recent[-1] - recent[0], 1e-9)
+
+    def overlay_lines(self):
+        lines = ["FPS %.1f" % self.fps()]
+        for name, stats in sorted(self.timers.items()):
+            if stats.recent:
+                mean, p95, worst = stats.summary()
+                lines.append("%-36s %7.2f %7.2f %7.2f ms" % (name[-36:], mean, p95, worst))
+        return lines
+
+    def maybe_report(self):
+        if time.perf_counter() - self.last_report >= REPORT_INTERVAL:
+            self.report()
+
+    def report(self):
+        self.last_report = time.perf_counter()
+        if self.handler is None:
+            return
+        log.info("fps=%.1f", self.fps())
+        for name, stats in sorted(self.timers.items()):
+            if stats.count > stats.reported:
+                mean, p95, worst = stats.summary()
+                log.info("%s calls=%d mean=%.3fms p95=%.3fms max=%.3fms",
+                         name, stats.count - stats.reported, mean, p95, worst)
+                stats.reported = stats.count
+        if self.counters:
+            log.info("counters %s", " ".join("%s=%d" % item for item in sorted(self.counters.items())))
+
+
+class TkOverlay:
+    # Shows the metrics in the corner of a Tk canvas; OVERLAY_KEY toggles
+    # it and turns recording on for as long as it is visible.
+    tag = "metrics-overlay"
+
+    def __init__(self, root, canvas, metrics=None):
+        self.canvas = canvas
+        self.metrics = metrics or METRICS
+        self.visible = False
+        self.was_enabled = False
+        self.job = None
+        self.idle_job = None
+        # Tk redraws once it is idle, so an idle callback after an event
+        # marks the frame that event produced.
+        self.metrics.on_event = self.on_event
+        root.bind("<%s>" % OVERLAY_KEY, self.toggle)
+
+    def toggle(self, event=None):
+        self.visible = not self.visible
+        if self.visible:
+            self.was_enabled = self.metrics.enabled
+            self.metrics.enable()
+            self.refresh()
+        else:
+            if self.job is not None:
+                self.canvas.after_cancel(self.job)
+                self.job = None
+            self.canvas.delete(self.tag)
+            if not self.was_enabled:
+                self.metrics.disable()
+
+    def on_event(self):
+        if self.idle_job is None:
+            self.idle_job = self.canvas.after_idle(self.on_idle)
+
+    def on_idle(self):
+        self.idle_job = None
+        self.metrics.frame()
+
+    def refresh(self):
+        # Redrawn from scratch: the trainers clear their canvas with
+        # delete("all"), and a new item is always on top.
+        self.canvas.delete(self.tag)
+        self.canvas.create_text(8, 8, anchor="nw", text="\n".join(self.metrics.overlay_lines()),
+                                font=("Courier", 9), fill="#c00000", tags=self.tag)
+        self.job = self.canvas.after(OVERLAY_MS, self.refresh)
+
+
+METRICS = Metrics(enabled=bool(os.environ.get(METRICS_ENV)))
+timed = METRICS.timed
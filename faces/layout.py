@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import json
+from compositor import Layer
+from storage import atomic_write
+
+LAYOUT_VERSION = 1
+DEFAULT_LAYOUT_SIZE = (800, 600)
+PART_ORDER = ("hair", "eyes", "nose", "lips")
+
+
+class PartLayout:
+    def __init__(self, variant=0, offset=(0, 0), scale=1.0):
+        self.variant = variant
+        self.offset = offset
+        self.scale = scale
+
+
+class Layout:
+    # Part placement relative to the centre of a canvas of the given size,
+    # so a layout renders the same way whatever the window size was. The
+    # editor saves its sessions in this format and export_faces.py reads it.
+    def __init__(self, size=DEFAULT_LAYOUT_SIZE, parts=None, active=None):
+        self.size = tuple(size)
+        self.parts = parts if parts is not None else {}
+        self.active = active
+
+    @property
+    def center(self):
+        return (self.size[0] // 2, self.size[1] // 2)
+
+    def part(self, folder):
+        return self.parts.get(folder) or PartLayout()
+
+    def layers(self, variants=None, order=None):
+        center_x, center_y = self.center
+        layers = []
+        for folder in order or self.parts:
+            part = self.part(folder)
+            index = part.variant if variants is None else variants[folder]
+            position = (center_x + part.offset[0], center_y + part.offset[1])
+            layers.append(Layer(folder, index, position, part.scale))
+        return layers
+
+    def to_dict(self):
+        data = {
+            "version": LAYOUT_VERSION,
+            "size": list(self.size),
+            "parts": {folder: {"variant": part.variant, "offset": list(part.offset), "scale": part.scale}
+                      for folder, part in self.parts.items()},
+        }
+        if self.active:
+            data["active"] = self.active
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("version") != LAYOUT_VERSION:
+            raise ValueError("unsupported layout version %r" % data.get("version"))
+        parts = {}
+        for folder, part in data["parts"].items():
+            parts[folder] = PartLayout(part.get("variant", 0), tuple(part.get("offset", (0, 0))),
+                                       part.get("scale", 1.0))
+        return cls(data.get("size", DEFAULT_LAYOUT_SIZE), parts, data.get("active"))
+
+
+def part_order(folders):
+    # Hair at the bottom, then the face parts; anything else goes on top.
+    known = [folder for folder in PART_ORDER if folder in folders]
+    return known + sorted(folder for folder in folders if folder not in PART_ORDER)
+
+
+def load_layout(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return Layout.from_dict(json.load(f))
+
+
+def save_layout(path, layout):
+    with atomic_write(path) as f:
+        json.dump(layout.to_dict(), f, separators=(",", ":"))
@@ -2,6 +2,9 @@
 import pygame
 import random
 import math
+from geometry import Segment, golden_cuts
+from instrument import METRICS, OVERLAY_KEY, OVERLAY_MS
+from spatial import SpatialGrid
 
 pygame.init()
 
@@ -10,7 +13,13 @@ BACKGROUND_COLOR = (240, 240, 240)
 LINE_COLOR = (0, 0, 0)
 BUTTON_COLOR = (100, 100, 100)
 TEXT_COLOR = (255, 255, 255)
-GOLDEN_RATIO = (1 + 5 ** 0.5) / 2
+HIT_SLACK = 0.1
+TICK_LENGTH = 10
+TICK_WIDTH = 2
+FPS = 60
+BUTTON_SIZE = (100, 30)
+BUTTONS = [("Show Hint", (10, 10)), ("Check Accuracy", (120, 10)), ("Refresh", (230, 10)), ("Change Color", (340, 10))]
+FONTS = {}
 
 screen = pygame.display.set_mode((WIDTH, HEIGHT))
 pygame.display.set_caption("Golden Ratio Trainer")
@@ -20,22 +29,21 @@ class Line:
         self.start = start
         self.end = end
         self.angle = angle
+        self.segment = Segment(start, end)
+        self.division_distances = ()
         self.user_divisions = []
         self.correct_divisions = []
         self.is_dragging = False
         self.drag_offset = (0, 0)
+        self.grid = None
+        self.key = None
 
     def calculate_correct_divisions(self):
-        length = math.hypot(self.end[0] - self.start[0], self.end[1] - self.start[1])
+        # Each division cuts what is left of the line in golden proportion;
+        # the k-th one lies at length * (1 - PHI ** -(k + 2)) from the start.
         num_divisions = random.randint(5, 7)
-        self.correct_divisions = []
-        current_length = length
-        for _ in range(num_divisions - 1):
-            division_point = current_length / GOLDEN_RATIO
-            dx = math.cos(self.angle) * (length - current_length + division_point)
-            dy = math.sin(self.angle) * (length - current_length + division_point)
-            self.correct_divisions.append((self.start[0] + dx, self.start[1] + dy))
-            current_length = division_point
+        self.division_distances = golden_cuts(self.segment.length, num_divisions - 1, first=2)
+        self.correct_divisions = self.segment.points_at(self.division_distances)
 
     def draw(self, surface, show_hint):
         pygame.draw.line(surface, LINE_COLOR, self.start, self.end, 2)
@@ -48,26 +56,37 @@ class Line:
     def move(self, dx, dy):
         self.start = (self.start[0] + dx, self.start[1] + dy)
         self.end = (self.end[0] + dx, self.end[1] + dy)
+        self.segment = self.segment.moved(dx, dy)
         self.correct_divisions = [(x + dx, y + dy) for x, y in self.correct_divisions]
         self.user_divisions = [(x + dx, y + dy) for x, y in self.user_divisions]
+        if self.grid is not None:
+            self.index(self.grid, self.key)
+
+    def index(self, grid, key):
+        # Files the line in grid under key; move() keeps it up to date.
+        self.grid = grid
+        self.key = key
+        grid.insert_segment(key, self.start, self.end, self.segment.reach(HIT_SLACK))
+
+    def rect(self):
+        # Everything draw() paints. Hint ticks sit on the line; user ticks
+        # sit where the click landed, which may be a few pixels off it.
+        margin = TICK_LENGTH + TICK_WIDTH + 1
+        left, right = sorted((self.start[0], self.end[0]))
+        top, bottom = sorted((self.start[1], self.end[1]))
+        rect = pygame.Rect(int(left), int(top), int(right - left) + 1, int(bottom - top) + 1).inflate(2 * margin, 2 * margin)
+        return rect.unionall([pygame.Rect(math.floor(x) - margin, math.floor(y) - margin, 2 * margin + 2, 2 * margin + 2)
+                              for x, y in self.user_divisions])
 
     def is_point_on_line(self, point):
-        x, y = point
-        x1, y1 = self.start
-        x2, y2 = self.end
-        d1 = math.hypot(x - x1, y - y1)
-        d2 = math.hypot(x2 - x, y2 - y)
-        line_length = math.hypot(x2 - x1, y2 - y1)
-        buffer = 0.1
-        return abs(d1 + d2 - line_length) < buffer
+        return self.segment.contains(point, HIT_SLACK)
 
 def draw_tick(surface, point, angle, color):
-    tick_length = 10
-    dx = math.sin(angle) * tick_length
-    dy = -math.cos(angle) * tick_length
+    dx = math.sin(angle) * TICK_LENGTH
+    dy = -math.cos(angle) * TICK_LENGTH
     start = (point[0] - dx, point[1] - dy)
     end = (point[0] + dx, point[1] + dy)
-    pygame.draw.line(surface, color, start, end, 2)
+    pygame.draw.line(surface, color, start, end, TICK_WIDTH)
 
 def generate_line(attempt):
     margin = 100
@@ -100,92 +119,188 @@ def generate_line(attempt):
 
     raise ValueError("Unable to generate a valid line after maximum attempts")
 
-def draw_button(surface, text, position, size):
-    pygame.draw.rect(surface, BUTTON_COLOR, (*position, *size))
-    font = pygame.font.Font(None, 24)
-    text_surface = font.render(text, True, TEXT_COLOR)
-    text_rect = text_surface.get_rect(center=(position[0] + size[0] // 2, position[1] + size[1] // 2))
-    surface.blit(text_surface, text_rect)
+def get_font(size, name=None):
+    # Loading a font reads the file from disk; every size is loaded once.
+    font = FONTS.get((name, size))
+    if font is None:
+        if name is None:
+            font = pygame.font.Font(None, size)
+        else:
+            font = pygame.font.SysFont(name, size)
+        FONTS[(name, size)] = font
+    return font
+
+def render_button(text, size):
+    surface = pygame.Surface(size)
+    surface.fill(BUTTON_COLOR)
+    text_surface = get_font(24).render(text, True, TEXT_COLOR)
+    surface.blit(text_surface, text_surface.get_rect(center=(size[0] // 2, size[1] // 2)))
+    return surface
+
+def render_metrics():
+    font = get_font(14, "monospace")
+    rows = [font.render(text, True, (192, 0, 0)) for text in METRICS.overlay_lines()]
+    surface = pygame.Surface((max(row.get_width() for row in rows), sum(row.get_height() for row in rows)),
+                             pygame.SRCALPHA)
+    y = 0
+    for row in rows:
+        surface.blit(row, (0, y))
+        y += row.get_height()
+    return surface, surface.get_rect(bottomleft=(10, HEIGHT - 10))
+
+def index_lines(lines):
+    grid = SpatialGrid()
+    for key, line in enumerate(lines):
+        line.index(grid, key)
+    return grid
+
+def draw_scene(surface, rects, lines, show_hint, buttons, overlays):
+    # Only the dirty rectangles are repainted; clipping keeps every draw
+    # call inside them.
+    for rect in rects:
+        surface.set_clip(rect)
+        surface.fill(BACKGROUND_COLOR)
+        for line in lines:
+            if rect.colliderect(line.rect()):
+                line.draw(surface, show_hint)
+        for button, position in buttons:
+            surface.blit(button, position)
+        for overlay, position in overlays:
+            surface.blit(overlay, position)
+    surface.set_clip(None)
 
 def calculate_accuracy(line):
     if not line.user_divisions:
         return 0
 
+    # User marks are matched to the divisions in order along the line.
     total_error = 0
-    for user_div, correct_div in zip(sorted(line.user_divisions), line.correct_divisions):
+    for user_div, correct_div in zip(sorted(line.user_divisions, key=line.segment.along), line.correct_divisions):
         error = math.hypot(user_div[0] - correct_div[0], user_div[1] - correct_div[1])
         total_error += error
 
-    total_length = math.hypot(line.end[0] - line.start[0], line.end[1] - line.start[1])
-    accuracy = max(0, (1 - total_error / total_length) * 100)
+    accuracy = max(0, (1 - total_error / line.segment.length) * 100)
     return accuracy
 
 def main():
+    # Nothing is drawn unless something changed: every change marks the
+    # rectangles it touched, and only those are repainted and pushed to the
+    # display, at most FPS times a second. With nothing to do the loop
+    # blocks in pygame.event.wait() instead of spinning.
     clock = pygame.time.Clock()
     lines = [generate_line(i) for i in range(3)]
+    # Clicks look up the lines under the pointer in a grid instead of
+    # testing every line; motion only moves the lines being dragged.
+    grid = index_lines(lines)
+    dragging = []
     show_hint = False
     attempt = 0
     user_color = LINE_COLOR
-    accuracy_text = ""
+    buttons = [(render_button(text, BUTTON_SIZE), position) for text, position in BUTTONS]
+    accuracy = None
+    metrics = None
+    metrics_due = 0
+    metrics_enabled = METRICS.enabled
+    overlay_key = pygame.key.key_code(OVERLAY_KEY.lower())
+    expose_events = {pygame.VIDEOEXPOSE, getattr(pygame, "WINDOWEXPOSED", pygame.VIDEOEXPOSE)}
+    dirty = [screen.get_rect()]
 
     running = True
     while running:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-            elif event.type == pygame.MOUSEBUTTONDOWN:
-                x, y = event.pos
-                if 10 <= x <= 110 and 10 <= y <= 40:  # Show hint button
-                    show_hint = True
-                elif 120 <= x <= 220 and 10 <= y <= 40:  # Check accuracy button
-                    total_accuracy = sum(calculate_accuracy(line) for line in lines) / len(lines)
-                    accuracy_text = f"Average Accuracy: {total_accuracy:.2f}%"
-                elif 230 <= x <= 330 and 10 <= y <= 40:  # Refresh button
-                    lines = [generate_line(attempt + i) for i in range(3)]
-                    attempt += 3
-                    accuracy_text = ""
-                elif 340 <= x <= 440 and 10 <= y <= 40:  # Color picker button
-                    user_color = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
-                else:
-                    for line in lines:
-                        if line.is_point_on_line((x, y)):
-                            if event.button == 1:  # Left click
-                                line.user_divisions.append((x, y))
-                            elif event.button == 3:  # Right click
-                                line.is_dragging = True
-                                line.drag_offset = (x - line.start[0], y - line.start[1])
-            elif event.type == pygame.MOUSEBUTTONUP:
-                if event.button == 1:  # Left mouse button
-                    show_hint = False
-                elif event.button == 3:  # Right mouse button
-                    for line in lines:
-                        line.is_dragging = False
-            elif event.type == pygame.MOUSEMOTION:
-                for line in lines:
-                    if line.is_dragging:
+        if metrics and pygame.time.get_ticks() >= metrics_due:
+            # The overlay is refreshed every OVERLAY_MS while it is shown.
+            dirty.append(metrics[1])
+            metrics = render_metrics()
+            dirty.append(metrics[1])
+            metrics_due = pygame.time.get_ticks() + OVERLAY_MS
+        if dirty:
+            events = pygame.event.get()
+        elif metrics:
+            events = [pygame.event.wait(max(1, metrics_due - pygame.time.get_ticks()))] + pygame.event.get()
+        else:
+            events = [pygame.event.wait()] + pygame.event.get()
+        with METRICS.measure("line.events"):
+            for event in events:
+                if event.type == pygame.QUIT:
+                    running = False
+                elif event.type in expose_events:
+                    dirty.append(screen.get_rect())
+                elif event.type == pygame.KEYDOWN and event.key == overlay_key:
+                    if metrics is None:
+                        metrics_enabled = METRICS.enabled
+                        METRICS.enable()
+                        metrics = render_metrics()
+                        metrics_due = pygame.time.get_ticks() + OVERLAY_MS
+                        dirty.append(metrics[1])
+                    else:
+                        if not metrics_enabled:
+                            METRICS.disable()
+                        dirty.append(metrics[1])
+                        metrics = None
+                elif event.type == pygame.MOUSEBUTTONDOWN:
+                    x, y = event.pos
+                    if 10 <= x <= 110 and 10 <= y <= 40:  # Show hint button
+                        if not show_hint:
+                            show_hint = True
+                            dirty.extend(line.rect() for line in lines)
+                    elif 120 <= x <= 220 and 10 <= y <= 40:  # Check accuracy button
+                        total_accuracy = sum(calculate_accuracy(line) for line in lines) / len(lines)
+                        if accuracy:
+                            dirty.append(accuracy[1])
+                        text_surface = get_font(24).render(f"Average Accuracy: {total_accuracy:.2f}%", True, (0, 0, 0))
+                        accuracy = (text_surface, text_surface.get_rect(topleft=(10, 50)))
+                        dirty.append(accuracy[1])
+                    elif 230 <= x <= 330 and 10 <= y <= 40:  # Refresh button
+                        lines = [generate_line(attempt + i) for i in range(3)]
+                        grid = index_lines(lines)
+                        dragging = []
+                        attempt += 3
+                        accuracy = None
+                        dirty.append(screen.get_rect())
+                    elif 340 <= x <= 440 and 10 <= y <= 40:  # Color picker button
+                        user_color = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
+                    else:
+                        for key in sorted(grid.at((x, y))):
+                            line = lines[key]
+                            if line.is_point_on_line((x, y)):
+                                if event.button == 1:  # Left click
+                                    line.user_divisions.append((x, y))
+                                    dirty.append(line.rect())
+                                elif event.button == 3:  # Right click
+                                    if not line.is_dragging:
+                                        dragging.append(line)
+                                    line.is_dragging = True
+                                    line.drag_offset = (x - line.start[0], y - line.start[1])
+                elif event.type == pygame.MOUSEBUTTONUP:
+                    if event.button == 1:  # Left mouse button
+                        if show_hint:
+                            show_hint = False
+                            dirty.extend(line.rect() for line in lines)
+                    elif event.button == 3:  # Right mouse button
+                        for line in dragging:
+                            line.is_dragging = False
+                        dragging = []
+                elif event.type == pygame.MOUSEMOTION:
+                    for line in dragging:
                         x, y = event.pos
                         dx = x - line.start[0] - line.drag_offset[0]
                         dy = y - line.start[1] - line.drag_offset[1]
+                        dirty.append(line.rect())
                         line.move(dx, dy)
+                        dirty.append(line.rect())
 
-        screen.fill(BACKGROUND_COLOR)
-        for line in lines:
-            line.draw(screen, show_hint)
-        
-        draw_button(screen, "Show Hint", (10, 10), (100, 30))
-        draw_button(screen, "Check Accuracy", (120, 10), (100, 30))
-        draw_button(screen, "Refresh", (230, 10), (100, 30))
-        draw_button(screen, "Change Color", (340, 10), (100, 30))
-
-        if accuracy_text:
-            font = pygame.font.Font(None, 24)
-            text_surface = font.render(accuracy_text, True, (0, 0, 0))
-            screen.blit(text_surface, (10, 50))
-
-        pygame.display.flip()
-        clock.tick(60)
+        if not dirty:
+            continue
+        with METRICS.measure("line.draw"):
+            rects = [rect.clip(screen.get_rect()) for rect in dirty]
+            overlays = [overlay for overlay in (accuracy, metrics) if overlay]
+            draw_scene(screen, rects, lines, show_hint, buttons, overlays)
+        pygame.display.update(rects)
+        METRICS.frame()
+        dirty = []
+        clock.tick(FPS)
 
     pygame.quit()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,6 +1,8 @@
 import tkinter as tk
 import random
 import math
+from geometry import PHI, Segment
+from instrument import TkOverlay, timed
 
 class GoldenRatioTrainer:
     def __init__(self, master):
@@ -23,6 +25,9 @@ class GoldenRatioTrainer:
         self.user_mark = None
         self.start_point = None
         self.end_point = None
+        self.segment = None
+        self.golden_points = ()
+        self.mark_point = None
         self.accuracy_text = None
         self.hint_markers = []
 
@@ -31,7 +36,9 @@ class GoldenRatioTrainer:
         self.canvas.bind("<Button-1>", self.place_mark)
         self.canvas.bind("<Button-3>", self.show_hint_markers)
         self.canvas.bind("<ButtonRelease-3>", self.hide_hint_markers)
+        self.overlay = TkOverlay(self.master, self.canvas)
 
+    @timed
     def refresh_task(self):
         self.canvas.delete("all")
         
@@ -47,12 +54,19 @@ class GoldenRatioTrainer:
         self.end_point = (x2, y2)
         
         self.line = self.canvas.create_line(x1, y1, x2, y2, width=2)
+        # Both golden points are known as soon as the line is.
+        self.segment = Segment(self.start_point, self.end_point)
+        short_segment = self.segment.length / PHI
+        self.golden_points = (self.segment.point_at(short_segment),
+                              self.segment.point_at(self.segment.length - short_segment))
         self.user_mark = None
+        self.mark_point = None
         self.hint_markers = []
         if self.accuracy_text:
             self.canvas.delete(self.accuracy_text)
             self.accuracy_text = None
 
+    @timed
     def place_mark(self, event):
         if self.user_mark:
             self.canvas.delete(self.user_mark)
@@ -62,25 +76,23 @@ class GoldenRatioTrainer:
         
         x, y = event.x, event.y
         self.user_mark = self.canvas.create_oval(x-5, y-5, x+5, y+5, fill="red")
+        self.mark_point = (x, y)
 
+    @timed
     def check_accuracy(self):
         if not self.user_mark:
             self.show_accuracy("Please place a mark on the line first")
             return
 
-        x, y = self.canvas.coords(self.user_mark)[:2]
-        total_length = self.distance(self.start_point, self.end_point)
-        segment1 = self.distance(self.start_point, (x, y))
-        segment2 = self.distance(self.end_point, (x, y))
+        segment1 = self.distance(self.start_point, self.mark_point)
+        segment2 = self.distance(self.end_point, self.mark_point)
 
         if segment1 > segment2:
             user_ratio = segment1 / segment2
         else:
             user_ratio = segment2 / segment1
 
-        golden_ratio = (1 + math.sqrt(5)) / 2
-
-        accuracy = 100 - abs(user_ratio - golden_ratio) / golden_ratio * 100
+        accuracy = 100 - abs(user_ratio - PHI) / PHI * 100
         self.show_accuracy(f"Your accuracy: {accuracy:.2f}%")
 
     def show_accuracy(self, text):
@@ -88,20 +100,14 @@ class GoldenRatioTrainer:
             self.canvas.delete(self.accuracy_text)
         self.accuracy_text = self.canvas.create_text(400, 520, text=text, font=("Arial", 12))
 
+    @timed
     def show_hint_markers(self, event):
         if self.hint_markers:
             return
 
-        total_length = self.distance(self.start_point, self.end_point)
-        golden_ratio = (1 + math.sqrt(5)) / 2
-        short_segment = total_length / golden_ratio
-
-        angle = math.atan2(self.end_point[1] - self.start_point[1], self.end_point[0] - self.start_point[0])
-        dx = short_segment * math.cos(angle)
-        dy = short_segment * math.sin(angle)
+        marker_point1, marker_point2 = self.golden_points
 
         # First marker (from start point)
-        marker_point1 = (self.start_point[0] + dx, self.start_point[1] + dy)
         self.hint_markers.append(self.canvas.create_oval(marker_point1[0]-5, marker_point1[1]-5, 
                                                          marker_point1[0]+5, marker_point1[1]+5, 
                                                          fill="green", outline="green"))
@@ -110,7 +116,6 @@ class GoldenRatioTrainer:
                                                          font=("Arial", 10), fill="green"))
 
         # Second marker (from end point)
-        marker_point2 = (self.end_point[0] - dx, self.end_point[1] - dy)
         self.hint_markers.append(self.canvas.create_oval(marker_point2[0]-5, marker_point2[1]-5, 
                                                          marker_point2[0]+5, marker_point2[1]+5, 
                                                          fill="green", outline="green"))
@@ -118,6 +123,7 @@ class GoldenRatioTrainer:
                                                          text="Golden Ratio Point", 
                                                          font=("Arial", 10), fill="green"))
 
+    @timed
     def hide_hint_markers(self, event):
         for marker in self.hint_markers:
             self.canvas.delete(marker)
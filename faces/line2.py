@@ -3,6 +3,9 @@
 import tkinter as tk
 import random
 import math
+from geometry import golden_cuts, golden_lengths, ratio_accuracy
+from instrument import TkOverlay, timed
+from spatial import SpatialGrid
 
 class GoldenRatioWorkshop:
     def __init__(self, master):
@@ -30,32 +33,41 @@ class GoldenRatioWorkshop:
         self.canvas.bind("<ButtonRelease-1>", self.on_release)
         self.canvas.bind("<Button-3>", self.show_hint)
         self.canvas.bind("<ButtonRelease-3>", self.hide_hint)
+        self.overlay = TkOverlay(self.master, self.canvas)
 
         self.refresh_task()
 
+    @timed
     def refresh_task(self):
         self.canvas.delete("all")
         self.stages[self.current_stage].setup()
 
+    @timed
     def check_accuracy(self):
         self.stages[self.current_stage].check_accuracy()
 
+    @timed
     def next_stage(self):
         self.current_stage = (self.current_stage + 1) % len(self.stages)
         self.refresh_task()
 
+    @timed
     def on_click(self, event):
         self.stages[self.current_stage].on_click(event)
 
+    @timed
     def on_drag(self, event):
         self.stages[self.current_stage].on_drag(event)
 
+    @timed
     def on_release(self, event):
         self.stages[self.current_stage].on_release(event)
 
+    @timed
     def show_hint(self, event):
         self.stages[self.current_stage].show_hint()
 
+    @timed
     def hide_hint(self, event):
         self.stages[self.current_stage].hide_hint()
 
@@ -63,6 +75,9 @@ class Stage1:
     def __init__(self, canvas):
         self.canvas = canvas
         self.lines = []
+        self.line_starts = []
+        self.user_lengths = []
+        self.ideal_lengths = ()
         self.colors = ["red", "blue", "green", "orange", "purple"]
         self.hint_lines = []
         self.accuracy_texts = []
@@ -70,9 +85,13 @@ class Stage1:
     def setup(self):
         self.canvas.delete("all")
         self.lines = []
+        self.line_starts = []
+        self.user_lengths = []
         self.accuracy_texts = []
         start_x, start_y = 100, 100
         length = random.randint(200, 400)
+        # The base line and five more, each PHI times shorter.
+        self.ideal_lengths = golden_lengths(length, 6)
         self.canvas.create_line(start_x, start_y, start_x + length, start_y, width=2)
         self.canvas.create_text(400, 50, text="Draw 5 lines in golden ratio proportion", font=("Arial", 14))
 
@@ -81,12 +100,15 @@ class Stage1:
             x, y = event.x, event.y
             line = self.canvas.create_line(x, y, x, y, fill=self.colors[len(self.lines)], width=2)
             self.lines.append(line)
+            self.line_starts.append((x, y))
+            self.user_lengths.append(0)
             self.accuracy_texts.append(self.canvas.create_text(x, y-15, text="", font=("Arial", 10), fill=self.colors[len(self.lines)-1]))
 
     def on_drag(self, event):
         if self.lines:
             x, y = event.x, event.y
-            x1, y1, _, _ = self.canvas.coords(self.lines[-1])
+            x1, y1 = self.line_starts[-1]
+            self.user_lengths[-1] = x - x1
             self.canvas.coords(self.lines[-1], x1, y1, x, y)
             self.canvas.coords(self.accuracy_texts[-1], (x1 + x) / 2, y1 - 15)
 
@@ -96,9 +118,7 @@ class Stage1:
     def show_hint(self):
         if not self.hint_lines:
             start_x, start_y = 100, 100
-            length = self.canvas.coords(self.canvas.find_all()[0])[2] - start_x
-            for i in range(5):
-                length /= 1.618
+            for i, length in enumerate(self.ideal_lengths[1:]):
                 self.hint_lines.append(self.canvas.create_line(start_x, start_y + 30 * (i + 1), 
                                                                start_x + length, start_y + 30 * (i + 1), 
                                                                dash=(5,5), fill="gray"))
@@ -109,12 +129,8 @@ class Stage1:
         self.hint_lines = []
 
     def check_accuracy(self):
-        ideal_lengths = [self.canvas.coords(self.canvas.find_all()[0])[2] - 100]
-        for _ in range(4):
-            ideal_lengths.append(ideal_lengths[-1] / 1.618)
-
-        for i, (line, text) in enumerate(zip(self.lines, self.accuracy_texts)):
-            user_length = self.canvas.coords(line)[2] - self.canvas.coords(line)[0]
+        ideal_lengths = self.ideal_lengths
+        for i, (user_length, text) in enumerate(zip(self.user_lengths, self.accuracy_texts)):
             accuracy = min(user_length / ideal_lengths[i], ideal_lengths[i] / user_length) * 100
             self.canvas.itemconfig(text, text=f"{accuracy:.1f}%")
 
@@ -122,24 +138,31 @@ class Stage2:
     def __init__(self, canvas):
         self.canvas = canvas
         self.marks = []
+        self.mark_positions = []
         self.hint_marks = []
         self.accuracy_texts = []
+        self.line_coords = None
+        self.ideal_positions = ()
 
     def setup(self):
         self.canvas.delete("all")
         self.marks = []
+        self.mark_positions = []
         self.accuracy_texts = []
         start_x, start_y = 100, 300
         length = random.randint(400, 600)
+        self.line_coords = (start_x, start_y, start_x + length, start_y)
+        self.ideal_positions = tuple(start_x + cut for cut in golden_cuts(length, 5))
         self.canvas.create_line(start_x, start_y, start_x + length, start_y, width=2)
         self.canvas.create_text(400, 50, text="Mark 6 proportional segments on the line", font=("Arial", 14))
 
     def on_click(self, event):
         x, y = event.x, event.y
-        line_coords = self.canvas.coords(self.canvas.find_all()[0])
+        line_coords = self.line_coords
         if len(self.marks) < 5 and line_coords[0] <= x <= line_coords[2] and abs(y - line_coords[1]) < 10:
             mark = self.canvas.create_line(x, y - 10, x, y + 10, fill="red", width=2)
             self.marks.append(mark)
+            self.mark_positions.append(x)
             self.accuracy_texts.append(self.canvas.create_text(x, y-20, text="", font=("Arial", 10), fill="red"))
             self.check_accuracy()
 
@@ -151,10 +174,8 @@ class Stage2:
 
     def show_hint(self):
         if not self.hint_marks:
-            line_coords = self.canvas.coords(self.canvas.find_all()[0])
-            start_x, length = line_coords[0], line_coords[2] - line_coords[0]
-            for i in range(1, 6):
-                x = start_x + length * (1 - 1 / (1.618 ** i))
+            line_coords = self.line_coords
+            for x in self.ideal_positions:
                 self.hint_marks.append(self.canvas.create_line(x, line_coords[1] - 15, x, line_coords[1] + 15, 
                                                                dash=(5,5), fill="gray"))
 
@@ -164,13 +185,9 @@ class Stage2:
         self.hint_marks = []
 
     def check_accuracy(self):
-        line_coords = self.canvas.coords(self.canvas.find_all()[0])
-        start_x, length = line_coords[0], line_coords[2] - line_coords[0]
-
-        ideal_positions = [start_x + length * (1 - 1 / (1.618 ** i)) for i in range(1, 6)]
-        user_positions = [self.canvas.coords(mark)[0] for mark in self.marks]
-
-        for i, (user_pos, text) in enumerate(zip(user_positions, self.accuracy_texts)):
+        length = self.line_coords[2] - self.line_coords[0]
+        ideal_positions = self.ideal_positions
+        for i, (user_pos, text) in enumerate(zip(self.mark_positions, self.accuracy_texts)):
             accuracy = (1 - abs(user_pos - ideal_positions[i]) / length) * 100
             self.canvas.itemconfig(text, text=f"{accuracy:.1f}%")
 
@@ -178,6 +195,9 @@ class Stage3:
     def __init__(self, canvas):
         self.canvas = canvas
         self.lines = []
+        self.lengths = []
+        self.rows = []
+        self.grid = SpatialGrid()
         self.arrows = []
         self.colors = ["red", "blue", "green", "orange", "purple"]
         self.selected_line = None
@@ -187,6 +207,9 @@ class Stage3:
     def setup(self):
         self.canvas.delete("all")
         self.lines = []
+        self.lengths = []
+        self.rows = []
+        self.grid.clear()
         self.arrows = []
         self.accuracy_texts = []
         start_y = 100
@@ -194,6 +217,9 @@ class Stage3:
             length = random.randint(100, 400)
             line = self.canvas.create_line(100, start_y, 100 + length, start_y, fill=self.colors[i], width=2)
             self.lines.append(line)
+            self.lengths.append(length)
+            self.rows.append(start_y)
+            self.index_line(i)
             arrow = self.canvas.create_line(100 + length - 10, start_y - 5, 100 + length, start_y, 100 + length - 10, start_y + 5, fill=self.colors[i], width=2)
             self.arrows.append(arrow)
             self.accuracy_texts.append(self.canvas.create_text(100 + length/2, start_y - 15, text="", font=("Arial", 10), fill=self.colors[i]))
@@ -202,21 +228,28 @@ class Stage3:
         self.check_accuracy()
 
     def on_click(self, event):
+        # Only the lines filed under the clicked cell are tested.
         self.selected_line = None
-        for line in self.lines:
-            coords = self.canvas.coords(line)
-            if coords[0] <= event.x <= coords[2] and abs(event.y - coords[1]) < 10:
-                self.selected_line = line
+        for index in sorted(self.grid.at((event.x, event.y))):
+            if 100 <= event.x <= 100 + self.lengths[index] and abs(event.y - self.rows[index]) < 10:
+                self.selected_line = index
                 break
 
+    def index_line(self, index):
+        # Everything on_click() accepts for the line: 10 px above and below.
+        y = self.rows[index]
+        self.grid.insert_box(index, (100, y - 10, 100 + self.lengths[index], y + 10))
+
     def on_drag(self, event):
-        if self.selected_line:
-            index = self.lines.index(self.selected_line)
-            coords = self.canvas.coords(self.selected_line)
-            new_length = max(10, event.x - coords[0])
-            self.canvas.coords(self.selected_line, coords[0], coords[1], coords[0] + new_length, coords[3])
-            self.canvas.coords(self.arrows[index], coords[0] + new_length - 10, coords[1] - 5, coords[0] + new_length, coords[1], coords[0] + new_length - 10, coords[1] + 5)
-            self.canvas.coords(self.accuracy_texts[index], coords[0] + new_length/2, coords[1] - 15)
+        if self.selected_line is not None:
+            index = self.selected_line
+            x, y = 100, self.rows[index]
+            new_length = max(10, event.x - x)
+            self.lengths[index] = new_length
+            self.index_line(index)
+            self.canvas.coords(self.lines[index], x, y, x + new_length, y)
+            self.canvas.coords(self.arrows[index], x + new_length - 10, y - 5, x + new_length, y, x + new_length - 10, y + 5)
+            self.canvas.coords(self.accuracy_texts[index], x + new_length/2, y - 15)
             self.check_accuracy()
 
     def on_release(self, event):
@@ -224,13 +257,9 @@ class Stage3:
 
     def show_hint(self):
         if not self.hint_lines:
-            start_y = 100
-            ideal_length = self.canvas.coords(self.lines[0])[2] - self.canvas.coords(self.lines[0])[0]
-            for i in range(5):
+            for ideal_length, start_y in zip(golden_lengths(self.lengths[0], 5), self.rows):
                 self.hint_lines.append(self.canvas.create_line(100, start_y + 30, 100 + ideal_length, start_y + 30, 
                                                                dash=(5,5), fill="gray"))
-                ideal_length /= 1.618
-                start_y += 60
 
     def hide_hint(self):
         for line in self.hint_lines:
@@ -238,11 +267,9 @@ class Stage3:
         self.hint_lines = []
 
     def check_accuracy(self):
-        lengths = [self.canvas.coords(line)[2] - self.canvas.coords(line)[0] for line in self.lines]
-        ideal_ratio = 1.618
+        lengths = self.lengths
         for i in range(4):
-            ratio = lengths[i] / lengths[i+1]
-            accuracy = min(ratio / ideal_ratio, ideal_ratio / ratio) * 100
+            accuracy = ratio_accuracy(lengths[i] / lengths[i+1])
             self.canvas.itemconfig(self.accuracy_texts[i], text=f"{accuracy:.1f}%")
         self.canvas.itemconfig(self.accuracy_texts[4], text="")  # Last line doesn't have a ratio
 
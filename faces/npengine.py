@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+from compositor import scale_key
+from parts import ImageCache
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DEFAULT_ARRAY_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def premultiply(image):
+    array = np.asarray(image.convert("RGBA"), dtype=np.float32) / 255.0
+    array[..., :3] *= array[..., 3:]
+    return array
+
+
+def premultiply_color(color):
+    red, green, blue, alpha = (channel / 255.0 for channel in color)
+    return (red * alpha, green * alpha, blue * alpha, alpha)
+
+
+def fill(array, color):
+    # Broadcasting a 4-tuple over (..., 4) is many times slower than a
+    # scalar fill, and most backgrounds have equal channels.
+    if len(set(color)) == 1:
+        array.fill(color[0])
+    else:
+        for channel, value in enumerate(color):
+            array[..., channel] = value
+
+
+def to_rgba8(batch):
+    # Straight (not premultiplied) 8-bit RGBA, the layout Pillow saves.
+    alpha = batch[..., 3:]
+    scale = np.zeros(alpha.shape, dtype=np.float32)
+    np.divide(255.0, alpha, out=scale, where=alpha > 0)
+    straight = batch * scale
+    np.multiply(alpha, 255.0, out=straight[..., 3:])
+    straight += 0.5
+    np.minimum(straight, 255.0, out=straight)
+    return straight.astype(np.uint8)
+
+
+def rows_index(rows):
+    # Rows of faces sharing a layer usually form a regular stride (the
+    # combinations are enumerated in mixed-radix order); a slice lets the
+    # update happen in place instead of through a gathered copy.
+    if len(rows) == 1:
+        return slice(rows[0], rows[0] + 1)
+    step = rows[1] - rows[0]
+    if all(b - a == step for a, b in zip(rows, rows[1:])):
+        return slice(rows[0], rows[-1] + 1, step)
+    return rows
+
+
+class ArrayCompositor:
+    # Renders faces straight into premultiplied float32 arrays. Every part
+    # is scaled once by the FaceCompositor (Lanczos, cached) and converted
+    # once; after that a face is pure array arithmetic. A batch of faces is
+    # composited layer by layer, with all faces sharing a variant updated
+    # in one vectorised operation, so the Python work per batch depends on
+    # the number of distinct variants, not on the number of faces. Only the
+    # box covered by some layer is composited; the rest is background.
+    def __init__(self, compositor, cache_bytes=DEFAULT_ARRAY_CACHE_BYTES):
+        if np is None:
+            raise ImportError("the NumPy engine needs numpy installed")
+        self.compositor = compositor
+        self.cache = ImageCache(cache_bytes, size=lambda arrays: arrays[0].nbytes * 2)
+
+    def arrays(self, folder, index, scale):
+        # The premultiplied part and its 1 - alpha, both computed once.
+        key = (self.compositor.library.key(folder, index), scale_key(scale))
+        arrays = self.cache.get(key)
+        if arrays is None:
+            array = premultiply(self.compositor.scaled(folder, index, scale))
+            arrays = (array, 1.0 - array[..., 3:])
+            self.cache.put(key, arrays)
+        return arrays
+
+    def placements(self, faces, size):
+        width, height = size
+        placements = []
+        for layers in zip(*faces):
+            groups = {}
+            for row, layer in enumerate(layers):
+                key = (layer.folder, layer.index, scale_key(layer.scale), tuple(layer.position))
+                groups.setdefault(key, []).append(row)
+            for rows in groups.values():
+                layer = layers[rows[0]]
+                array, inverse = self.arrays(layer.folder, layer.index, layer.scale)
+                left, top = self.compositor.origin(layer.folder, layer.index, layer.position, layer.scale)
+                box = (max(left, 0), max(top, 0),
+                       min(left + array.shape[1], width), min(top + array.shape[0], height))
+                if box[2] > box[0] and box[3] > box[1]:
+                    source = (slice(box[1] - top, box[3] - top), slice(box[0] - left, box[2] - left))
+                    placements.append((rows_index(rows), box, array[source], inverse[source]))
+        return placements
+
+    def render_region(self, faces, size, background=(0, 0, 0, 0)):
+        # Returns the premultiplied pixels of the box every layer falls in,
+        # shape (len(faces), box height, box width, 4), and that box.
+        placements = self.placements(faces, size)
+        if not placements:
+            return np.empty((len(faces), 0, 0, 4), dtype=np.float32), (0, 0, 0, 0)
+        left = min(box[0] for _, box, _, _ in placements)
+        top = min(box[1] for _, box, _, _ in placements)
+        right = max(box[2] for _, box, _, _ in placements)
+        bottom = max(box[3] for _, box, _, _ in placements)
+        region = np.empty((len(faces), bottom - top, right - left, 4), dtype=np.float32)
+        fill(region, premultiply_color(background))
+        for rows, box, source, inverse in placements:
+            target = (rows, slice(box[1] - top, box[3] - top), slice(box[0] - left, box[2] - left))
+            if isinstance(rows, slice):
+                view = region[target]
+                view *= inverse
+                view += source
+            else:
+                region[target] = region[target] * inverse + source
+        return region, (left, top, right, bottom)
+
+    def render_batch(self, faces, size, background=(0, 0, 0, 0)):
+        # faces is a list of layer lists with the same parts in the same
+        # order; the result is premultiplied float32 of shape
+        # (len(faces), height, width, 4).
+        region, (left, top, right, bottom) = self.render_region(faces, size, background)
+        batch = np.empty((len(faces), size[1], size[0], 4), dtype=np.float32)
+        fill(batch, premultiply_color(background))
+        batch[:, top:bottom, left:right] = region
+        return batch
+
+    def render(self, layers, size, background=(0, 0, 0, 0)):
+        return self.render_batch([layers], size, background)[0]
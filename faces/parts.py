@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".bmp")
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+HASH_CHUNK = 1024 * 1024
+
+log = logging.getLogger(__name__)
+
+
+def list_images(path):
+    return sorted(f for f in os.listdir(path) if f.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def image_bytes(image):
+    return image.width * image.height * len(image.getbands())
+
+
+def file_digest(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def probe_image(path):
+    # Image.open only parses the header; pixels are decoded on demand.
+    # Hashing the file bytes finds duplicates without decoding them.
+    with Image.open(path) as image:
+        size = image.size
+    return size, file_digest(path)
+
+
+def alpha_bbox(image):
+    bbox = image.getchannel("A").getbbox()
+    return bbox or (0, 0, 1, 1)
+
+
+class PartVariant:
+    def __init__(self, folder, index, path, size, bbox=None, digest=None):
+        self.folder = folder
+        self.index = index
+        self.path = path
+        # Variants with the same digest share one decoded bitmap.
+        self.digest = digest or "%s/%d" % (folder, index)
+        # size is the full frame of the source file; bbox is the part of
+        # that frame actually stored when transparent margins are trimmed.
+        self.size = size
+        self.bbox = tuple(bbox) if bbox else (0, 0, size[0], size[1])
+
+    @property
+    def stored_size(self):
+        return (self.bbox[2] - self.bbox[0], self.bbox[3] - self.bbox[1])
+
+    @property
+    def anchor(self):
+        # Layer positions refer to the frame centre, the point a Tk item
+        # with anchor=CENTER would sit on, expressed in stored pixels.
+        return (self.size[0] // 2 - self.bbox[0], self.size[1] // 2 - self.bbox[1])
+
+    def __repr__(self):
+        return "PartVariant(%r, %r, %r, %r)" % (self.folder, self.index, self.path, self.size)
+
+
+class ImageCache:
+    def __init__(self, budget=DEFAULT_CACHE_BYTES, size=image_bytes):
+        self.budget = budget
+        self.size = size
+        self.used = 0
+        self.entries = OrderedDict()
+        # Background decoders share the cache with the UI thread.
+        self.lock = threading.RLock()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        with self.lock:
+            image = self.entries.get(key)
+            if image is not None:
+                self.entries.move_to_end(key)
+            return image
+
+    def put(self, key, image):
+        with self.lock:
+            self.discard(key)
+            self.entries[key] = image
+            self.used += self.size(image)
+            # The newest entry always stays, even if it alone is over budget.
+            while self.used > self.budget and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.used -= self.size(evicted)
+
+    def discard(self, key):
+        with self.lock:
+            image = self.entries.pop(key, None)
+            if image is not None:
+                self.used -= self.size(image)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.used = 0
+
+
+class PartLibrary:
+    # Built from a PartRegistry or an AssetPack, which know every variant
+    # already; the library itself only decodes and caches the pixels.
+    def __init__(self, cache_bytes=DEFAULT_CACHE_BYTES, trim=True):
+        self.folders = {}
+        self.trim = trim
+        self.cache = ImageCache(cache_bytes)
+        self.pack = None
+        self.variants = {}
+        self.by_digest = {}
+
+    @classmethod
+    def from_pack(cls, pack, cache_bytes=DEFAULT_CACHE_BYTES):
+        library = cls(cache_bytes)
+        library.pack = pack
+        for folder in pack.parts():
+            library.folders[folder] = pack.path
+            library.variants[folder] = [
+                PartVariant(folder, index, os.path.join(folder, entry["name"]), tuple(entry["size"]),
+                            entry["bbox"], entry.get("digest"))
+                for index, entry in enumerate(pack.entries(folder))]
+        library.index_digests()
+        return library
+
+    @classmethod
+    def from_registry(cls, registry, cache_bytes=DEFAULT_CACHE_BYTES, parts=None):
+        # The registry already knows every file's size and digest, so no
+        # image is opened here.
+        library = cls(cache_bytes)
+        for folder in parts or registry.parts():
+            library.folders[folder] = registry.folders[folder]
+            library.variants[folder] = registry.variants(folder)
+        library.index_digests()
+        return library
+
+
+    def refresh(self, folder, paths=()):
+        # Rescans one folder after the files in paths were added, changed or
+        # removed. Variants of untouched files are kept as they are, decoded
+        # bitmaps included; only the new and changed files are read.
+        paths = set(paths)
+        known = {variant.path: variant for variant in self.variants.get(folder, [])}
+        try:
+            filenames = list_images(self.folders[folder])
+        except OSError as e:
+            # The folder was deleted or renamed: it has no variants left.
+            log.info("cannot list %s: %s", self.folders[folder], e)
+            filenames = []
+        variants = []
+        for filename in filenames:
+            img_path = os.path.join(self.folders[folder], filename)
+            variant = known.get(img_path)
+            if variant is None or img_path in paths:
+                try:
+                    size, digest = probe_image(img_path)
+                    variant = PartVariant(folder, 0, img_path, size, digest=digest)
+                except OSError as e:
+                    # Most likely still being written; the next change
+                    # notification picks it up.
+                    log.info("skipping %s: %s", img_path, e)
+                    continue
+            variant.index = len(variants)
+            variants.append(variant)
+        self.variants[folder] = variants
+        self.index_digests()
+        for variant in known.values():
+            if variant.digest not in self.by_digest:
+                self.cache.discard(variant.digest)
+        return variants
+
+    def index_digests(self):
+        self.by_digest = {}
+        for variants in self.variants.values():
+            for variant in variants:
+                self.by_digest.setdefault(variant.digest, []).append(variant)
+        for group in self.duplicates():
+            log.info("%s share identical content; decoding them once", ", ".join(v.path for v in group))
+
+    def duplicates(self):
+        return [group for group in self.by_digest.values() if len(group) > 1]
+
+    def count(self, folder):
+        return len(self.variants[folder])
+
+    def variant(self, folder, index):
+        return self.variants[folder][index]
+
+    def key(self, folder, index):
+        return self.variants[folder][index].digest
+
+    def cached(self, folder, index):
+        return self.cache.get(self.key(folder, index))
+
+    def image(self, folder, index):
+        variant = self.variants[folder][index]
+        image = self.cache.get(variant.digest)
+        if image is None:
+            image, bbox = self.decode(variant)
+            for duplicate in self.by_digest.get(variant.digest, [variant]):
+                duplicate.bbox = bbox
+            self.cache.put(variant.digest, image)
+        return image
+
+    def mip(self, folder, index, level):
+        # Pre-scaled power-of-two levels, when the parts come from a pack.
+        if self.pack is None:
+            return None
+        return self.pack.image_at_scale(folder, index, 0.5 ** level)
+
+    def decode(self, variant):
+        if self.pack is not None:
+            return self.pack.image(variant.folder, variant.index), variant.bbox
+        with Image.open(variant.path) as source:
+            image = source.convert("RGBA")
+        if not self.trim:
+            return image, variant.bbox
+        # Transparent margins are cropped away once, here; the recorded bbox
+        # keeps the layer anchored where the full frame would be.
+        bbox = alpha_bbox(image)
+        return image.crop(bbox), bbox
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+import os
+from PIL import Image
+from storage import atomic_write, cache_path
+
+RECENT_LIMIT = 10
+THUMBNAIL_SIZE = (128, 128)
+
+log = logging.getLogger(__name__)
+
+
+class RecentSessions:
+    # Most recently saved or opened sessions, newest first, each with a small
+    # thumbnail of its composite so the list never has to re-render faces.
+    def __init__(self, path=None, limit=RECENT_LIMIT):
+        self.path = path or cache_path("recent.json")
+        self.limit = limit
+        self.thumbnails = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.paths = json.load(f)
+        except (OSError, ValueError):
+            self.paths = []
+
+    def entries(self):
+        return [path for path in self.paths if os.path.exists(path)]
+
+    def thumbnail_path(self, path):
+        name = hashlib.blake2b(os.path.abspath(path).encode("utf-8"), digest_size=16).hexdigest()
+        return os.path.join(os.path.dirname(self.path), "thumbnails", name + ".png")
+
+    def add(self, path, image=None):
+        path = os.path.abspath(path)
+        if path in self.paths:
+            self.paths.remove(path)
+        self.paths.insert(0, path)
+        for dropped in self.paths[self.limit:]:
+            self.forget_thumbnail(dropped)
+        del self.paths[self.limit:]
+        if image is not None:
+            thumbnail = image.copy()
+            thumbnail.thumbnail(THUMBNAIL_SIZE, Image.LANCZOS)
+            thumb_path = self.thumbnail_path(path)
+            try:
+                os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+                with atomic_write(thumb_path, "wb") as f:
+                    thumbnail.save(f, "PNG")
+            except OSError as e:
+                log.warning("cannot write thumbnail %s: %s", thumb_path, e)
+            self.thumbnails[path] = thumbnail
+        self.save()
+
+    def forget_thumbnail(self, path):
+        self.thumbnails.pop(path, None)
+        try:
+            os.remove(self.thumbnail_path(path))
+        except OSError:
+            pass
+
+    def thumbnail(self, path):
+        # Decoded once per run and then served from memory.
+        path = os.path.abspath(path)
+        image = self.thumbnails.get(path)
+        if image is None:
+            try:
+                with Image.open(self.thumbnail_path(path)) as source:
+                    image = source.convert("RGBA")
+            except OSError:
+                return None
+            self.thumbnails[path] = image
+        return image
+
+    def save(self):
+        try:
+            with atomic_write(self.path) as f:
+                json.dump(self.paths, f)
+        except OSError as e:
+            log.warning("cannot write recent sessions %s: %s", self.path, e)
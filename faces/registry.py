@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+import os
+from parts import PartVariant, list_images, probe_image
+from storage import atomic_write, cache_path
+
+FACES_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_ENV = "ONEGIN_FACES_DIR"
+REGISTRY_VERSION = 1
+
+log = logging.getLogger(__name__)
+
+
+def faces_root():
+    return os.environ.get(ROOT_ENV) or FACES_DIR
+
+
+class PartRegistry:
+    # Every subfolder of root holding images is a part category. The index
+    # (file names, frame sizes and content digests) is cached on disk; on
+    # startup folders whose mtime did not change are not listed again, and
+    # only files whose mtime or size changed have their headers and bytes
+    # read.
+    def __init__(self, root=None, cache_file=None):
+        self.root = os.path.abspath(root or faces_root())
+        if cache_file is None:
+            name = hashlib.blake2b(self.root.encode("utf-8"), digest_size=8).hexdigest()
+            cache_file = cache_path("registry", name + ".json")
+        self.cache_file = cache_file
+        self.index = None
+        self.folders = {}
+        self.scan()
+
+    def parts(self):
+        return list(self.folders)
+
+    def entries(self, folder):
+        return self.index["folders"][folder]["files"]
+
+    def variants(self, folder):
+        path = self.folders[folder]
+        return [PartVariant(folder, index, os.path.join(path, entry["name"]), tuple(entry["size"]),
+                            digest=entry["digest"])
+                for index, entry in enumerate(self.entries(folder))]
+
+    def scan(self):
+        cached = self.read_cache()
+        root_mtime = os.stat(self.root).st_mtime_ns
+        if cached.get("mtime") == root_mtime:
+            names = list(cached["folders"])
+        else:
+            names = [name for name in sorted(os.listdir(self.root))
+                     if os.path.isdir(os.path.join(self.root, name))]
+        # Empty folders stay in the index with their mtime: adding images
+        # to one changes only its own mtime, not the root's.
+        folders = {}
+        for name in names:
+            folders[name] = self.scan_folder(name, cached.get("folders", {}).get(name))
+        index = {"version": REGISTRY_VERSION, "root": self.root, "mtime": root_mtime, "folders": folders}
+        if index != cached:
+            self.write_cache(index)
+        self.index = index
+        self.folders = {name: os.path.join(self.root, name) for name, folder in folders.items() if folder["files"]}
+
+    def scan_folder(self, name, cached):
+        path = os.path.join(self.root, name)
+        mtime = os.stat(path).st_mtime_ns
+        known = {entry["name"]: entry for entry in cached["files"]} if cached else {}
+        if cached and cached["mtime"] == mtime:
+            filenames = [entry["name"] for entry in cached["files"]]
+        else:
+            filenames = list_images(path)
+        files = []
+        for filename in filenames:
+            img_path = os.path.join(path, filename)
+            try:
+                stat = os.stat(img_path)
+                entry = known.get(filename)
+                if entry is None or (entry["mtime"], entry["bytes"]) != (stat.st_mtime_ns, stat.st_size):
+                    size, digest = probe_image(img_path)
+                    entry = {"name": filename, "size": list(size), "digest": digest,
+                             "mtime": stat.st_mtime_ns, "bytes": stat.st_size}
+            except OSError as e:
+                log.info("skipping %s: %s", img_path, e)
+                continue
+            files.append(entry)
+        return {"mtime": mtime, "files": files}
+
+    def read_cache(self):
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if cached.get("version") != REGISTRY_VERSION or cached.get("root") != self.root:
+            return {}
+        return cached
+
+    def write_cache(self, index):
+        try:
+            with atomic_write(self.cache_file) as f:
+                json.dump(index, f, separators=(",", ":"))
+        except OSError as e:
+            log.warning("cannot write part index %s: %s", self.cache_file, e)
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+import tkinter as tk
+from PIL import Image, ImageTk
+from compositor import paste_at
+
+
+class SceneLayer:
+    def __init__(self, item):
+        self.item = item
+        self.photo = None
+        self.origin = None
+        self.visible = False
+
+
+class CanvasScene:
+    # Keeps the last state pushed to every canvas item and records what
+    # changed since, so flush() only touches the items that need it.
+    uses_photos = True
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.layers = {}
+        self.pending = {}
+
+    def add(self, name):
+        item = self.canvas.create_image(0, 0, anchor=tk.NW, state='hidden')
+        self.layers[name] = SceneLayer(item)
+        return item
+
+    def remove(self, name):
+        layer = self.layers.pop(name)
+        self.pending.pop(name, None)
+        self.canvas.delete(layer.item)
+
+    def clear(self):
+        for name in list(self.layers):
+            self.remove(name)
+
+    def set_active(self, name):
+        pass
+
+    def set(self, name, attr, value):
+        changes = self.pending.setdefault(name, {})
+        if getattr(self.layers[name], attr) == value:
+            changes.pop(attr, None)
+        else:
+            changes[attr] = value
+        if not changes:
+            del self.pending[name]
+
+    def set_image(self, name, image, photo):
+        # PhotoImage compares by identity, which is what matters here.
+        self.set(name, "photo", photo)
+
+    def set_origin(self, name, x, y):
+        self.set(name, "origin", (x, y))
+
+    def set_visible(self, name, visible):
+        self.set(name, "visible", visible)
+
+    def flush(self):
+        for name, changes in self.pending.items():
+            layer = self.layers[name]
+            options = {}
+            if "photo" in changes:
+                options["image"] = changes["photo"]
+            if "visible" in changes:
+                options["state"] = 'normal' if changes["visible"] else 'hidden'
+            if options:
+                self.canvas.itemconfig(layer.item, **options)
+            if "origin" in changes:
+                self.canvas.coords(layer.item, *changes["origin"])
+            for attr, value in changes.items():
+                setattr(layer, attr, value)
+        touched = len(self.pending)
+        self.pending.clear()
+        return touched
+
+
+class FlatLayer:
+    def __init__(self):
+        self.image = None
+        self.origin = None
+        self.visible = False
+
+
+class FlatScene:
+    # Draws the whole stack as one canvas image. Layers below and above the
+    # active one are flattened once and cached, so dragging or scaling the
+    # active layer re-composites three bitmaps instead of redrawing every
+    # layer, and Tk only has a single item to blit.
+    uses_photos = False
+
+    def __init__(self, canvas, order):
+        self.canvas = canvas
+        self.order = list(order)
+        self.item = self.canvas.create_image(0, 0, anchor=tk.NW, state='hidden')
+        self.layers = {}
+        self.active = None
+        self.static = None
+        self.photo = None
+        self.dirty = False
+
+    def add(self, name):
+        self.layers[name] = FlatLayer()
+        self.invalidate(None)
+        return self.item
+
+    def remove(self, name):
+        del self.layers[name]
+        self.invalidate(None)
+
+    def clear(self):
+        self.layers = {}
+        self.canvas.delete(self.item)
+
+    def set_active(self, name):
+        if name != self.active:
+            self.active = name
+            self.invalidate(None)
+
+    def invalidate(self, name):
+        if name != self.active or self.active is None:
+            self.static = None
+        self.dirty = True
+
+    def set_image(self, name, image, photo):
+        if self.layers[name].image is not image:
+            self.layers[name].image = image
+            self.invalidate(name)
+
+    def set_origin(self, name, x, y):
+        if self.layers[name].origin != (x, y):
+            self.layers[name].origin = (x, y)
+            self.invalidate(name)
+
+    def set_visible(self, name, visible):
+        if self.layers[name].visible != visible:
+            self.layers[name].visible = visible
+            self.invalidate(name)
+
+    def drawable(self, names):
+        parts = []
+        for name in names:
+            layer = self.layers.get(name)
+            if layer and layer.visible and layer.image is not None and layer.origin is not None:
+                parts.append((layer.image, layer.origin[0], layer.origin[1]))
+        return parts
+
+    def flatten(self, parts):
+        if not parts:
+            return []
+        if len(parts) == 1:
+            return parts
+        left = min(x for image, x, y in parts)
+        top = min(y for image, x, y in parts)
+        right = max(x + image.width for image, x, y in parts)
+        bottom = max(y + image.height for image, x, y in parts)
+        frame = Image.new("RGBA", (right - left, bottom - top))
+        for image, x, y in parts:
+            paste_at(frame, image, x - left, y - top)
+        return [(frame, left, top)]
+
+    def flush(self):
+        if not self.dirty:
+            return 0
+        names = [name for name in self.order if name in self.layers]
+        if self.active in names:
+            split = names.index(self.active)
+            below, active, above = names[:split], [self.active], names[split + 1:]
+        else:
+            below, active, above = names, [], []
+        if self.static is None:
+            self.static = (self.flatten(self.drawable(below)), self.flatten(self.drawable(above)))
+        parts = self.flatten(self.static[0] + self.drawable(active) + self.static[1])
+        self.dirty = False
+        if not parts:
+            self.canvas.itemconfig(self.item, state='hidden')
+            return 1
+        frame, left, top = parts[0]
+        self.photo = ImageTk.PhotoImage(frame)
+        self.canvas.itemconfig(self.item, image=self.photo, state='normal')
+        self.canvas.coords(self.item, left, top)
+        return 1
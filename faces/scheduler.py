@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import operator
+import time
+
+FRAME_MS = 16
+RESIZE_DELAY_MS = 100
+
+
+def keep_last(old, new):
+    return new
+
+
+class FrameScheduler:
+    # Merges bursts of input events into one update per frame. Handlers only
+    # record what happened (a zoom factor to multiply in, the last pointer
+    # position, a resize to debounce); once per frame every pending update
+    # runs once with the merged value, so a frame does the same bounded work
+    # however many events arrived in it. Subclasses supply the timer.
+    def __init__(self, frame_ms=FRAME_MS):
+        self.frame_ms = frame_ms
+        self.pending = {}
+        self.armed = None
+        self.last_frame = 0.0
+
+    def merge(self, key, value, callback, combine=keep_last, delay_ms=0):
+        # callback(value) runs at the next frame at least delay_ms after the
+        # latest call, with every value since combined into one.
+        due = time.perf_counter() + delay_ms / 1000.0
+        entry = self.pending.get(key)
+        if entry is not None:
+            value = combine(entry[0], value)
+        self.pending[key] = (value, callback, due)
+        self.schedule()
+
+    def accumulate(self, key, factor, callback):
+        self.merge(key, factor, callback, operator.mul)
+
+    def add(self, key, amount, callback):
+        self.merge(key, amount, callback, operator.add)
+
+    def latest(self, key, value, callback):
+        self.merge(key, value, callback)
+
+    def debounce(self, key, callback, delay_ms=RESIZE_DELAY_MS):
+        self.merge(key, None, lambda value: callback(), delay_ms=delay_ms)
+
+    def cancel(self, key):
+        self.pending.pop(key, None)
+
+    def flush(self, key=None):
+        # Runs pending updates now: before a release ends a drag, say.
+        for name in ([key] if key is not None else list(self.pending)):
+            entry = self.pending.pop(name, None)
+            if entry is not None:
+                entry[1](entry[0])
+
+    def schedule(self):
+        # The timer fires for the earliest pending update, but never sooner
+        # than one frame after the previous one.
+        now = time.perf_counter()
+        due = max(self.last_frame + self.frame_ms / 1000.0, min(entry[2] for entry in self.pending.values()))
+        if self.armed is not None and self.armed <= due:
+            return
+        self.armed = due
+        self.arm(max(0, int(round((due - now) * 1000))))
+
+    def tick(self):
+        self.armed = None
+        now = time.perf_counter()
+        self.last_frame = now
+        for key in [key for key, entry in self.pending.items() if entry[2] <= now]:
+            entry = self.pending.pop(key, None)
+            if entry is not None:
+                entry[1](entry[0])
+        if self.pending:
+            self.schedule()
+
+    def arm(self, ms):
+        # Starts the timer, replacing one already running.
+        raise NotImplementedError
+
+    def stop(self):
+        self.pending.clear()
+
+
+class TkFrameScheduler(FrameScheduler):
+    def __init__(self, root, frame_ms=FRAME_MS):
+        super().__init__(frame_ms)
+        self.root = root
+        self.job = None
+
+    def arm(self, ms):
+        if self.job is not None:
+            self.root.after_cancel(self.job)
+        self.job = self.root.after(ms, self.on_timer)
+
+    def on_timer(self):
+        self.job = None
+        self.tick()
+
+    def stop(self):
+        super().stop()
+        if self.job is not None:
+            self.root.after_cancel(self.job)
+            self.job = None
+        self.armed = None
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import math
+
+CELL_SIZE = 32
+
+
+class SpatialGrid:
+    # A uniform grid of square cells over the canvas. Every item is filed
+    # under the cells it can be hit in, so finding what lies under the
+    # pointer looks at one cell however many items there are. Moving an
+    # item only touches the cells it leaves and enters.
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.items = {}
+
+    def cell(self, x):
+        return int(math.floor(x / self.cell_size))
+
+    def box_cells(self, box):
+        left, top, right, bottom = box
+        return frozenset((col, row) for row in range(self.cell(top), self.cell(bottom) + 1)
+                         for col in range(self.cell(left), self.cell(right) + 1))
+
+    def segment_cells(self, start, end, margin):
+        # The cells holding some point within margin of the segment: for
+        # each row of cells, the part of the segment passing through that
+        # row (widened by margin) gives the columns.
+        (x0, y0), (x1, y1) = start, end
+        cells = set()
+        for row in range(self.cell(min(y0, y1) - margin), self.cell(max(y0, y1) + margin) + 1):
+            if y0 == y1:
+                xs = (x0, x1)
+            else:
+                low = (row * self.cell_size - margin - y0) / (y1 - y0)
+                high = ((row + 1) * self.cell_size + margin - y0) / (y1 - y0)
+                xs = [x0 + (x1 - x0) * min(max(t, 0.0), 1.0) for t in (low, high)]
+            for col in range(self.cell(min(xs) - margin), self.cell(max(xs) + margin) + 1):
+                cells.add((col, row))
+        return frozenset(cells)
+
+    def insert(self, item, cells):
+        # Files item under cells, replacing wherever it was before.
+        old = self.items.get(item, frozenset())
+        if old == cells:
+            return
+        for cell in old - cells:
+            bucket = self.cells[cell]
+            bucket.discard(item)
+            if not bucket:
+                del self.cells[cell]
+        for cell in cells - old:
+            self.cells.setdefault(cell, set()).add(item)
+        self.items[item] = cells
+
+    def insert_box(self, item, box):
+        self.insert(item, self.box_cells(box))
+
+    def insert_segment(self, item, start, end, margin=0):
+        self.insert(item, self.segment_cells(start, end, margin))
+
+    def at(self, point):
+        # Items that may be hit at point; the caller does the exact test.
+        return self.cells.get((self.cell(point[0]), self.cell(point[1])), ())
+
+    def clear(self):
+        self.cells.clear()
+        self.items.clear()
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import contextlib
+import os
+import threading
+
+CACHE_ENV = "ONEGIN_CACHE_DIR"
+
+
+def cache_dir():
+    # ONEGIN_CACHE_DIR wins; otherwise the platform's per-user cache folder.
+    path = os.environ.get(CACHE_ENV)
+    if not path:
+        base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") \
+            or os.path.join(os.path.expanduser("~"), ".cache")
+        path = os.path.join(base, "onegin")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def cache_path(*names):
+    path = os.path.join(cache_dir(), *names)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+@contextlib.contextmanager
+def atomic_write(path, mode="w"):
+    # with atomic_write(path) as f: ... writes a temporary file next to path
+    # and moves it into place only once complete, so no reader and no
+    # resumed run ever sees half a file. The temporary name is per thread,
+    # as workers may write the same file at once.
+    tmp_path = "%s.%d.tmp" % (path, threading.get_ident())
+    try:
+        with open(tmp_path, mode, encoding=None if "b" in mode else "utf-8") as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
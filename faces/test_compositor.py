@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import unittest
+from PIL import Image
+from compositor import FaceCompositor
+from parts import PartLibrary
+from registry import PartRegistry
+
+
+class ScaledSizeTest(unittest.TestCase):
+    # A part with transparent margins is trimmed when it is decoded; a
+    # scaled copy made before that must still come from the trimmed size.
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        os.mkdir(os.path.join(self.tmp.name, "part"))
+        image = Image.new("RGBA", (200, 160), (0, 0, 0, 0))
+        image.paste((200, 100, 50, 255), (20, 10, 170, 130))
+        image.save(os.path.join(self.tmp.name, "part", "part.png"))
+        self.registry = PartRegistry(self.tmp.name, os.path.join(self.tmp.name, "index.json"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def compositor(self):
+        return FaceCompositor(PartLibrary.from_registry(self.registry))
+
+    def test_cold_and_warm_scaled_sizes_match(self):
+        for scale in (0.5, 0.7, 0.2, 1.5):
+            warm = self.compositor()
+            warm.original("part", 0)
+            self.assertEqual(self.compositor().scaled("part", 0, scale).size,
+                             warm.scaled("part", 0, scale).size)
+
+    def test_scaled_size_comes_from_trimmed_pixels(self):
+        self.assertEqual(self.compositor().scaled("part", 0, 0.5).size, (75, 60))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import itertools
+import os
+import tempfile
+import unittest
+from unittest import mock
+from PIL import Image
+from export_faces import combinations, export_faces, face_name, face_parts, open_library
+from layout import Layout
+from storage import CACHE_ENV
+
+
+class CombinationsTest(unittest.TestCase):
+    def test_every_combination_in_order(self):
+        counts = (2, 3, 1, 4)
+        self.assertEqual(list(combinations(counts)), list(itertools.product(*(range(n) for n in counts))))
+
+    def test_sample_is_a_sorted_subset(self):
+        counts = (5, 4, 3)
+        everything = list(combinations(counts))
+        sample = list(combinations(counts, sample=7, seed=1))
+        self.assertEqual(len(sample), 7)
+        self.assertEqual(sample, sorted(sample))
+        self.assertLessEqual(set(sample), set(everything))
+        self.assertEqual(sample, list(combinations(counts, sample=7, seed=1)))
+
+    def test_oversized_sample_gives_everything(self):
+        self.assertEqual(list(combinations((2, 2), sample=10, seed=1)), list(combinations((2, 2))))
+
+
+class ExportTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        environ = mock.patch.dict(os.environ, {CACHE_ENV: os.path.join(self.tmp.name, "cache")})
+        environ.start()
+        self.addCleanup(environ.stop)
+        self.root = os.path.join(self.tmp.name, "faces")
+        self.output = os.path.join(self.tmp.name, "out")
+        for folder, count in (("hair", 2), ("eyes", 3), ("nose", 0)):
+            os.makedirs(os.path.join(self.root, folder))
+            for index in range(count):
+                Image.new("RGBA", (20, 10), (40 * index, 80, 120, 255)).save(
+                    os.path.join(self.root, folder, "%d.png" % index))
+        self.layout = Layout((40, 30))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_parts_without_variants_are_left_out(self):
+        order, counts = face_parts(open_library(self.root), self.layout)
+        self.assertEqual((order, counts), (["hair", "eyes"], [2, 3]))
+
+    def test_rerun_skips_finished_faces(self):
+        self.assertEqual(export_faces(self.root, self.output, self.layout, workers=1), (6, 0))
+        expected = {face_name(["hair", "eyes"], combo) for combo in combinations((2, 3))}
+        self.assertEqual(set(os.listdir(self.output)), expected)
+        os.remove(os.path.join(self.output, face_name(["hair", "eyes"], (1, 2))))
+        self.assertEqual(export_faces(self.root, self.output, self.layout, workers=1), (1, 5))
+        with Image.open(os.path.join(self.output, face_name(["hair", "eyes"], (1, 2)))) as face:
+            self.assertEqual(face.size, (40, 30))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import tempfile
+import unittest
+from layout import Layout, PartLayout, load_layout, part_order, save_layout
+
+
+class RoundTripTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "layout.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_saved_layout_loads_back(self):
+        layout = Layout((640, 480), {"hair": PartLayout(2, (-5, 12), 0.75), "eyes": PartLayout(1)}, "eyes")
+        save_layout(self.path, layout)
+        loaded = load_layout(self.path)
+        self.assertEqual(loaded.to_dict(), layout.to_dict())
+        self.assertEqual(loaded.size, (640, 480))
+        self.assertEqual(loaded.part("hair").offset, (-5, 12))
+        self.assertEqual(loaded.active, "eyes")
+        self.assertEqual(os.listdir(self.tmp.name), ["layout.json"])
+
+    def test_layers_survive_the_round_trip(self):
+        layout = Layout((400, 300), {"nose": PartLayout(3, (10, -20), 1.5)})
+        save_layout(self.path, layout)
+        layer = load_layout(self.path).layers()[0]
+        self.assertEqual((layer.folder, layer.index, layer.position, layer.scale), ("nose", 3, (210, 130), 1.5))
+
+    def test_unknown_version_is_rejected(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"version": 99, "parts": {}}, f)
+        with self.assertRaises(ValueError):
+            load_layout(self.path)
+
+    def test_part_order_puts_hair_first(self):
+        self.assertEqual(part_order(["lips", "zz", "hair", "aa", "eyes"]), ["hair", "eyes", "lips", "aa", "zz"])
+
+
+if __name__ == "__main__":
+    unittest.main()
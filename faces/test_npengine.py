@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import unittest
+from PIL import Image
+from compositor import FaceCompositor, Layer
+from parts import PartLibrary
+from registry import PartRegistry
+
+try:
+    import numpy as np
+    from npengine import ArrayCompositor, to_rgba8
+except ImportError:
+    np = None
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class PillowMatchTest(unittest.TestCase):
+    # The NumPy engine must give the faces Pillow gives, up to rounding:
+    # overlapping translucent layers, parts hanging off the canvas, scaled
+    # parts and a coloured background included.
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        for folder, size, box, color in (("hair", (120, 90), (10, 5, 110, 80), (90, 60, 20, 255)),
+                                         ("eyes", (80, 40), (5, 5, 75, 35), (20, 120, 200, 160)),
+                                         ("lips", (60, 30), (0, 0, 60, 30), (220, 30, 60, 90))):
+            os.mkdir(os.path.join(self.tmp.name, folder))
+            for index in range(2):
+                image = Image.new("RGBA", size, (0, 0, 0, 0))
+                image.paste(color[:3] + (color[3] // (index + 1),), box)
+                image.save(os.path.join(self.tmp.name, folder, "%d.png" % index))
+        registry = PartRegistry(self.tmp.name, os.path.join(self.tmp.name, "index.json"))
+        self.compositor = FaceCompositor(PartLibrary.from_registry(registry))
+        self.engine = ArrayCompositor(self.compositor)
+        self.size = (160, 120)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def faces(self):
+        return [[Layer("hair", hair, (80, 60), 1.0), Layer("eyes", eyes, (70, 45), 0.7),
+                 Layer("lips", lips, (150, 115), 1.3)]
+                for hair in range(2) for eyes in range(2) for lips in range(2)]
+
+    def assertMatches(self, engine_pixels, layers, background):
+        expected = np.asarray(self.compositor.render(layers, self.size, background), dtype=np.int16)
+        difference = np.abs(engine_pixels.astype(np.int16) - expected)
+        self.assertLessEqual(difference.max(), 2)
+
+    def test_batch_matches_pillow(self):
+        faces = self.faces()
+        batch = to_rgba8(self.engine.render_batch(faces, self.size))
+        self.assertEqual(batch.shape, (len(faces), self.size[1], self.size[0], 4))
+        for pixels, layers in zip(batch, faces):
+            self.assertMatches(pixels, layers, (0, 0, 0, 0))
+
+    def test_single_face_on_a_background_matches_pillow(self):
+        background = (250, 240, 230, 255)
+        for layers in self.faces()[:3]:
+            self.assertMatches(to_rgba8(self.engine.render(layers, self.size, background)), layers, background)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+from PIL import Image
+from parts import PartLibrary
+from registry import PartRegistry
+
+
+class RefreshTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.folder = os.path.join(self.tmp.name, "hair")
+        os.mkdir(self.folder)
+        for name in ("a.png", "b.png"):
+            Image.new("RGBA", (8, 8), (255, 0, 0, 255)).save(os.path.join(self.folder, name))
+        registry = PartRegistry(self.tmp.name, os.path.join(self.tmp.name, "index.json"))
+        self.library = PartLibrary.from_registry(registry)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_removed_folder_has_no_variants(self):
+        paths = [variant.path for variant in self.library.variants["hair"]]
+        shutil.rmtree(self.folder)
+        self.assertEqual(self.library.refresh("hair", paths), [])
+        self.assertEqual(self.library.count("hair"), 0)
+
+    def test_renamed_folder_has_no_variants(self):
+        os.rename(self.folder, self.folder + "-old")
+        self.assertEqual(self.library.refresh("hair"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
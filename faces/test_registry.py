@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import unittest
+from PIL import Image
+from registry import PartRegistry
+
+
+class InvalidationTest(unittest.TestCase):
+    # Each registry here starts from the index the previous one cached.
+    # Timestamps are moved on by hand so that a change never falls within
+    # the file system's mtime resolution.
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, "faces")
+        self.cache_file = os.path.join(self.tmp.name, "index.json")
+        os.mkdir(self.root)
+        self.tick = 1000000000
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def touch(self, *paths):
+        self.tick += 10
+        for path in paths:
+            os.utime(path, (self.tick, self.tick))
+
+    def save(self, folder, name, size, color=(255, 0, 0, 255)):
+        path = os.path.join(self.root, folder, name)
+        Image.new("RGBA", size, color).save(path)
+        self.touch(path, os.path.dirname(path))
+        return path
+
+    def registry(self):
+        return PartRegistry(self.root, self.cache_file)
+
+    def test_empty_folder_is_no_part_until_it_has_images(self):
+        os.mkdir(os.path.join(self.root, "hair"))
+        self.touch(os.path.join(self.root, "hair"), self.root)
+        self.assertEqual(self.registry().parts(), [])
+        self.save("hair", "a.png", (8, 8))
+        registry = self.registry()
+        self.assertEqual(registry.parts(), ["hair"])
+        self.assertEqual([variant.size for variant in registry.variants("hair")], [(8, 8)])
+
+    def test_emptied_folder_is_dropped(self):
+        os.mkdir(os.path.join(self.root, "hair"))
+        path = self.save("hair", "a.png", (8, 8))
+        self.touch(self.root)
+        self.assertEqual(self.registry().parts(), ["hair"])
+        os.remove(path)
+        self.touch(os.path.dirname(path))
+        self.assertEqual(self.registry().parts(), [])
+
+    def test_changed_file_is_read_again(self):
+        os.mkdir(os.path.join(self.root, "eyes"))
+        self.save("eyes", "a.png", (8, 8))
+        self.touch(self.root)
+        before = self.registry().variants("eyes")[0]
+        self.save("eyes", "a.png", (12, 6), (0, 0, 255, 255))
+        after = self.registry().variants("eyes")[0]
+        self.assertEqual(after.size, (12, 6))
+        self.assertNotEqual(after.digest, before.digest)
+
+    def test_unchanged_folder_comes_from_the_index(self):
+        os.mkdir(os.path.join(self.root, "eyes"))
+        self.save("eyes", "a.png", (8, 8))
+        self.touch(self.root)
+        self.registry()
+        with open(self.cache_file, "rb") as f:
+            cached = f.read()
+        self.assertEqual(self.registry().variants("eyes")[0].size, (8, 8))
+        with open(self.cache_file, "rb") as f:
+            self.assertEqual(f.read(), cached)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import unittest
+from scheduler import FrameScheduler
+
+
+class ManualScheduler(FrameScheduler):
+    # The timer is the test: it records each request and ticks by hand.
+    def __init__(self):
+        super().__init__()
+        self.timers = []
+
+    def arm(self, ms):
+        self.timers.append(ms)
+
+
+class CoalescingTest(unittest.TestCase):
+    def setUp(self):
+        self.frames = ManualScheduler()
+        self.calls = []
+
+    def record(self, name):
+        return lambda value: self.calls.append((name, value))
+
+    def test_burst_runs_once_per_frame(self):
+        for _ in range(5):
+            self.frames.accumulate("zoom", 2, self.record("zoom"))
+            self.frames.add("scroll", 3, self.record("scroll"))
+        for point in ((1, 1), (2, 2), (3, 3)):
+            self.frames.latest("drag", point, self.record("drag"))
+        self.assertEqual(len(self.frames.timers), 1)
+        self.frames.tick()
+        self.assertEqual(sorted(self.calls), [("drag", (3, 3)), ("scroll", 15), ("zoom", 32)])
+        self.assertEqual(self.frames.pending, {})
+
+    def test_next_burst_starts_afresh(self):
+        self.frames.add("scroll", 1, self.record("scroll"))
+        self.frames.tick()
+        self.frames.add("scroll", 4, self.record("scroll"))
+        self.frames.tick()
+        self.assertEqual(self.calls, [("scroll", 1), ("scroll", 4)])
+
+    def test_debounce_waits_for_the_delay(self):
+        for _ in range(3):
+            self.frames.debounce("resize", lambda: self.calls.append("resize"))
+        self.frames.tick()
+        self.assertEqual(self.calls, [])
+        self.assertIn("resize", self.frames.pending)
+        self.frames.flush()
+        self.assertEqual(self.calls, ["resize"])
+
+    def test_cancel_drops_the_update(self):
+        self.frames.latest("drag", (1, 1), self.record("drag"))
+        self.frames.cancel("drag")
+        self.frames.tick()
+        self.assertEqual(self.calls, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import math
+import random
+import unittest
+from spatial import SpatialGrid
+
+
+def distance_to_segment(point, start, end):
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    length = dx * dx + dy * dy
+    t = ((point[0] - start[0]) * dx + (point[1] - start[1]) * dy) / length if length else 0.0
+    t = min(max(t, 0.0), 1.0)
+    return math.hypot(point[0] - start[0] - t * dx, point[1] - start[1] - t * dy)
+
+
+class LookupTest(unittest.TestCase):
+    # Whatever a brute-force search over every item finds at a point, the
+    # grid must return from that point's cell.
+    def setUp(self):
+        self.random = random.Random(7)
+
+    def point(self):
+        return (self.random.uniform(-50, 650), self.random.uniform(-50, 450))
+
+    def test_segments_match_brute_force(self):
+        grid = SpatialGrid()
+        segments = {}
+        for item in range(60):
+            start, end = self.point(), self.point()
+            if item % 10 == 0:
+                end = (self.random.uniform(-50, 650), start[1])
+            segments[item] = (start, end)
+            grid.insert_segment(item, start, end, margin=6)
+        for _ in range(3000):
+            point = self.point()
+            near = {item for item, (start, end) in segments.items() if distance_to_segment(point, start, end) <= 6}
+            self.assertLessEqual(near, set(grid.at(point)), point)
+
+    def test_boxes_match_brute_force(self):
+        grid = SpatialGrid()
+        boxes = {}
+        for item in range(40):
+            (x0, y0), (x1, y1) = self.point(), self.point()
+            boxes[item] = (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+            grid.insert_box(item, boxes[item])
+        for _ in range(3000):
+            x, y = point = self.point()
+            inside = {item for item, box in boxes.items() if box[0] <= x <= box[2] and box[1] <= y <= box[3]}
+            self.assertLessEqual(inside, set(grid.at(point)), point)
+
+    def test_moved_item_leaves_its_old_cells(self):
+        grid = SpatialGrid()
+        grid.insert_box("a", (0, 0, 10, 10))
+        grid.insert_box("a", (200, 200, 210, 210))
+        self.assertEqual(set(grid.at((5, 5))), set())
+        self.assertEqual(set(grid.at((205, 205))), {"a"})
+        self.assertEqual(set(grid.cells), set(grid.items["a"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
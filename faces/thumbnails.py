@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import os
+from PIL import Image
+from storage import atomic_write, cache_dir
+
+THUMBNAIL_SIZE = (96, 96)
+
+
+class ThumbnailCache:
+    # Small previews of part variants, kept on disk between runs. The file
+    # name carries the content digest and the source mtime, so an edited
+    # or replaced file gets a new thumbnail and stale ones are never read.
+    def __init__(self, directory=None, size=THUMBNAIL_SIZE):
+        self.directory = directory or os.path.join(cache_dir(), "thumbnails", "%dx%d" % size)
+        self.size = size
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, variant):
+        try:
+            mtime = os.stat(variant.path).st_mtime_ns
+        except OSError:
+            # Pack entries have no file of their own; the digest is enough.
+            mtime = 0
+        return os.path.join(self.directory, "%s-%x.png" % (variant.digest.replace("/", "_"), mtime))
+
+    def thumbnail(self, library, folder, index):
+        path = self.path(library.variant(folder, index))
+        try:
+            with Image.open(path) as cached:
+                return cached.convert("RGBA")
+        except OSError:
+            pass
+        image = library.image(folder, index).copy()
+        image.thumbnail(self.size, Image.LANCZOS)
+        # Several workers may build thumbnails at once.
+        with atomic_write(path, "wb") as f:
+            image.save(f, "PNG")
+        return image
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+from parts import IMAGE_EXTENSIONS
+
+ADDED = "added"
+CHANGED = "changed"
+REMOVED = "removed"
+POLL_INTERVAL = 1.0
+SETTLE_DELAY = 0.2
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0)
+INOTIFY_EVENT = struct.Struct("iIII")
+INOTIFY_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+
+log = logging.getLogger(__name__)
+
+
+def snapshot(path):
+    files = {}
+    try:
+        names = os.listdir(path)
+    except OSError:
+        return files
+    for name in names:
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            full_path = os.path.join(path, name)
+            try:
+                stat = os.stat(full_path)
+            except OSError:
+                continue
+            files[full_path] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+def diff(old, new):
+    changes = [(ADDED, path) for path in new if path not in old]
+    changes += [(CHANGED, path) for path in new if path in old and new[path] != old[path]]
+    changes += [(REMOVED, path) for path in old if path not in new]
+    return changes
+
+
+class FolderWatcher:
+    # Reports added, changed and removed images in a set of part folders as
+    # callback(folder, changes), from the watcher thread; the apps hand the
+    # call over to their UI thread. Subclasses only decide when a folder is
+    # worth looking at again, the changes always come from comparing stat()
+    # snapshots, so both backends report exactly the same thing.
+    def __init__(self, folders, callback):
+        self.folders = dict(folders)
+        self.callback = callback
+        self.snapshots = {folder: snapshot(path) for folder, path in self.folders.items()}
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name=type(self).__name__, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def check(self, folder):
+        current = snapshot(self.folders[folder])
+        changes = diff(self.snapshots[folder], current)
+        self.snapshots[folder] = current
+        if changes:
+            log.info("%s: %d file(s) changed", folder, len(changes))
+            self.callback(folder, changes)
+
+    def run(self):
+        raise NotImplementedError
+
+
+class PollingWatcher(FolderWatcher):
+    def __init__(self, folders, callback, interval=POLL_INTERVAL):
+        super().__init__(folders, callback)
+        self.interval = interval
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            for folder in self.folders:
+                self.check(folder)
+
+
+class InotifyWatcher(FolderWatcher):
+    # Sleeps in the kernel until something in a watched folder is written,
+    # moved or deleted; nothing is polled while the folders are idle.
+    def __init__(self, folders, callback, libc):
+        super().__init__(folders, callback)
+        self.libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+        for folder, path in self.folders.items():
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(path), INOTIFY_MASK)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), "cannot watch %s" % path)
+            self.watches[wd] = folder
+
+    def read_events(self):
+        folders = set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return folders
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size + length
+            if wd in self.watches:
+                folders.add(self.watches[wd])
+        return folders
+
+    def run(self):
+        try:
+            while not self.stopped.is_set():
+                ready, _, _ = select.select([self.fd], [], [], POLL_INTERVAL)
+                if not ready:
+                    continue
+                folders = self.read_events()
+                # Copying a batch of files raises a burst of events; wait for
+                # it to settle and rescan each folder once.
+                while select.select([self.fd], [], [], SETTLE_DELAY)[0]:
+                    folders |= self.read_events()
+                for folder in folders:
+                    self.check(folder)
+        finally:
+            os.close(self.fd)
+
+
+def load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+def watch_folders(folders, callback, polling=False):
+    libc = None if polling else load_libc()
+    if libc is not None:
+        try:
+            return InotifyWatcher(folders, callback, libc).start()
+        except OSError as e:
+            log.info("inotify unavailable (%s), polling instead", e)
+    return PollingWatcher(folders, callback).start()
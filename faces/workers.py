@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+POLL_MS = 15
+
+log = logging.getLogger(__name__)
+
+
+class BackgroundLoader:
+    def __init__(self, post, max_workers=DEFAULT_WORKERS):
+        # post(fn) must arrange for fn to run on the UI thread.
+        self.post = post
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.generations = {}
+        self.lock = threading.Lock()
+
+    def submit(self, key, work, callback, error=None):
+        # A newer request for the same key makes the older ones stale: they
+        # are skipped if not started yet and their results are dropped. If
+        # work raises, the exception is logged and passed to error instead.
+        with self.lock:
+            generation = self.generations.get(key, 0) + 1
+            self.generations[key] = generation
+        return self.executor.submit(self.run, key, generation, work, callback, error)
+
+    def cancel(self, key):
+        with self.lock:
+            if key in self.generations:
+                self.generations[key] += 1
+
+    def is_current(self, key, generation):
+        with self.lock:
+            return self.generations.get(key) == generation
+
+    def run(self, key, generation, work, callback, error=None):
+        if not self.is_current(key, generation):
+            return
+        try:
+            result = work()
+        except Exception as e:
+            log.exception("background job %r failed", key)
+            if error is not None and self.is_current(key, generation):
+                # e is unbound once the except block ends; bind it now.
+                self.post(lambda e=e: self.finish(key, generation, error, e))
+            return
+        if self.is_current(key, generation):
+            self.post(lambda: self.finish(key, generation, callback, result))
+
+    def finish(self, key, generation, callback, result):
+        if self.is_current(key, generation):
+            callback(result)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class TkDispatcher:
+    # Tk must only be touched from the thread running mainloop, so workers
+    # hand their callbacks over through a queue the UI thread drains.
+    def __init__(self, root, interval=POLL_MS):
+        self.root = root
+        self.interval = interval
+        self.pending = queue.Queue()
+        self.job = self.root.after(self.interval, self.poll)
+
+    def post(self, fn):
+        self.pending.put(fn)
+
+    def poll(self):
+        # Rearmed first: a failing callback is logged and must not stop
+        # the results that follow it.
+        self.job = self.root.after(self.interval, self.poll)
+        while True:
+            try:
+                fn = self.pending.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                fn()
+            except Exception:
+                log.exception("callback %r failed", fn)
+
+    def stop(self):
+        self.root.after_cancel(self.job)